@@ -2,6 +2,8 @@ import os
 import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
@@ -13,6 +15,47 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
+def add_missing_columns():
+    """
+    Add columns that were introduced after a table was first created.
+    db.create_all() only creates missing tables, never missing columns.
+    """
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.execute(text(
+                    f"ALTER TABLE {preparer.quote(table.name)} "
+                    f"ADD COLUMN {preparer.quote(column.name)} {column_type}"
+                ))
+            logging.info(f"Added column {table.name}.{column.name}")
+
+def create_schema(attempts=3):
+    """
+    Create missing tables and columns. Worker processes booting at the same
+    time race on the same DDL; the loser fails because the table or column
+    already exists, so it inspects the schema again instead of failing to boot.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            db.create_all()
+            add_missing_columns()
+            return
+        except DBAPIError as e:
+            if attempt == attempts:
+                raise
+            logging.warning(f"Schema update raced with another process, checking again: {e}")
+
 def create_app():
     # Create the app
     app = Flask(__name__)
@@ -29,7 +72,13 @@ def create_app():
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
         "pool_recycle": 300,
         "pool_pre_ping": True,
+        # Threaded workers run many requests at once, each needing a connection briefly
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 20)),
     }
+    if app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        # Wait for SQLite's write lock instead of failing when requests overlap
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"]["connect_args"] = {"timeout": 30}
     
     # Initialize the app with the extension
     db.init_app(app)
@@ -40,16 +89,36 @@ def create_app():
     with app.app_context():
         # Import models to ensure tables are created
         import models
-        db.create_all()
+        create_schema()
     
     # Register blueprints
     from routes.main import main_bp
     from routes.documents import documents_bp
     from routes.chat import chat_bp
+    from routes.admin import admin_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(documents_bp, url_prefix='/documents')
     app.register_blueprint(chat_bp, url_prefix='/chat')
+    app.register_blueprint(admin_bp, url_prefix='/admin')
+    
+    # Trace requests and their database queries
+    from services.tracing import init_tracing
+    init_tracing(app)
+    
+    # Register CLI commands
+    from cli import register_commands
+    register_commands(app)
+    
+    # Start the retention janitor with the first request, so CLI commands never run it
+    from config import Config
+    if Config.JANITOR_ENABLED:
+        from services.janitor import JanitorService
+        janitor = JanitorService()
+        
+        @app.before_request
+        def start_janitor():
+            janitor.start(app)
     
     return app
 
@@ -0,0 +1,39 @@
+import json
+import uuid
+import click
+from flask import Flask
+from config import Config
+
+def register_commands(app: Flask):
+    """
+    Register maintenance commands with the Flask CLI
+    """
+    @app.cli.command('janitor')
+    def run_janitor():
+        """Expire old data, remove orphans and compact the database once."""
+        from services.janitor import JanitorService
+        report = JanitorService().run_once()
+        click.echo(json.dumps(report, indent=2))
+    
+    @app.cli.command('ingest')
+    @click.argument('directory', type=click.Path(exists=True, file_okay=False))
+    @click.option('--session', 'session_id', help='Session to add the documents to (default: a new session).')
+    @click.option('--workers', type=int, default=Config.INGEST_WORKERS, show_default=True,
+                  help='Files processed in parallel.')
+    @click.option('--checkpoint', help='Checkpoint file (default: ingest-<session>.jsonl).')
+    @click.option('--retry-failed', is_flag=True, help='Process files that failed in earlier runs again.')
+    def ingest(directory, session_id, workers, checkpoint, retry_failed):
+        """Ingest every supported file under DIRECTORY, resuming an earlier run."""
+        from services.bulk_ingest import BulkIngestor
+        session_id = session_id or str(uuid.uuid4())
+        checkpoint = checkpoint or f"ingest-{session_id}.jsonl"
+        click.echo(f"Ingesting into session {session_id} (checkpoint: {checkpoint})")
+        
+        ingestor = BulkIngestor(app, session_id, checkpoint, workers=workers, report=click.echo)
+        summary = ingestor.run(
+            directory,
+            app.config['ALLOWED_EXTENSIONS'],
+            max_size=app.config['MAX_CONTENT_LENGTH'],
+            retry_failed=retry_failed
+        )
+        click.echo(json.dumps(summary, indent=2))
@@ -12,6 +12,7 @@ class Config:
     
     # GROQ API
     GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+    GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL", "https://api.groq.com/openai/v1")  # e.g. scripts/stub_groq.py for load tests
     
     # Flask Config
     FLASK_SECRET_KEY = os.environ.get("FLASK_SECRET_KEY", "dev-secret-key")
@@ -24,4 +25,121 @@ class Config:
     
     # Search settings
     TOP_K_RESULTS = 5
+    SEARCH_CACHE_TTL_SECONDS = float(os.environ.get("SEARCH_CACHE_TTL_SECONDS", 30))
+    SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 256))
     MIN_RELEVANCE_SCORE = 0.5
+    
+    # Document routing settings
+    ROUTING_ENABLED = os.environ.get("ROUTING_ENABLED", "true").lower() == "true"
+    ROUTING_MAX_DOCUMENTS = int(os.environ.get("ROUTING_MAX_DOCUMENTS", 3))
+    SUMMARY_INPUT_CHARS = int(os.environ.get("SUMMARY_INPUT_CHARS", 4000))
+    # Summaries wait longer for LLM capacity than questions; background ones are retried with
+    # backoff while there is no capacity or GROQ fails transiently, inline ones (flask ingest) try once
+    SUMMARY_QUEUE_TIMEOUT = float(os.environ.get("SUMMARY_QUEUE_TIMEOUT", 60))
+    SUMMARY_MAX_ATTEMPTS = int(os.environ.get("SUMMARY_MAX_ATTEMPTS", 5))
+    SUMMARY_RETRY_SECONDS = float(os.environ.get("SUMMARY_RETRY_SECONDS", 30))
+    
+    # LLM context settings
+    LLM_CONTEXT_TOKEN_BUDGET = int(os.environ.get("LLM_CONTEXT_TOKEN_BUDGET", 6000))
+    MAP_REDUCE_MAX_WORKERS = int(os.environ.get("MAP_REDUCE_MAX_WORKERS", 4))
+    
+    # Retention settings (0 disables cleanup for that entity)
+    # The janitor runs in one server process; enable it only where the data may be expired
+    JANITOR_ENABLED = os.environ.get("JANITOR_ENABLED", "false").lower() == "true"
+    JANITOR_LOCK_FILE = os.environ.get("JANITOR_LOCK_FILE", "instance/janitor.lock")
+    JANITOR_INTERVAL_SECONDS = int(os.environ.get("JANITOR_INTERVAL_SECONDS", 3600))
+    JANITOR_BATCH_SIZE = int(os.environ.get("JANITOR_BATCH_SIZE", 500))
+    CHAT_MESSAGE_TTL_DAYS = int(os.environ.get("CHAT_MESSAGE_TTL_DAYS", 30))
+    CHAT_SESSION_TTL_DAYS = int(os.environ.get("CHAT_SESSION_TTL_DAYS", 30))
+    DOCUMENT_TTL_DAYS = int(os.environ.get("DOCUMENT_TTL_DAYS", 0))  # days since the session was last used
+    FAILED_DOCUMENT_TTL_HOURS = int(os.environ.get("FAILED_DOCUMENT_TTL_HOURS", 24))
+    ORPHAN_FILE_TTL_HOURS = int(os.environ.get("ORPHAN_FILE_TTL_HOURS", 1))
+    DB_MAINTENANCE_INTERVAL_HOURS = int(os.environ.get("DB_MAINTENANCE_INTERVAL_HOURS", 24))
+    
+    # Near-duplicate detection settings
+    DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "true").lower() == "true"
+    DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", 0.8))
+    PASSAGE_MAX_CHARS = int(os.environ.get("PASSAGE_MAX_CHARS", 800))
+    
+    # Re-ranking settings
+    RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "true").lower() == "true"
+    RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", 50))
+    RERANK_TOP_N = int(os.environ.get("RERANK_TOP_N", 8))
+    
+    # Admission control settings (per worker process)
+    LLM_MAX_CONCURRENT = int(os.environ.get("LLM_MAX_CONCURRENT", 8))
+    LLM_QUEUE_SIZE = int(os.environ.get("LLM_QUEUE_SIZE", 16))
+    LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", 5))
+    DI_MAX_CONCURRENT = int(os.environ.get("DI_MAX_CONCURRENT", 4))
+    DI_QUEUE_SIZE = int(os.environ.get("DI_QUEUE_SIZE", 8))
+    DI_QUEUE_TIMEOUT = float(os.environ.get("DI_QUEUE_TIMEOUT", 10))
+    SESSION_MAX_IN_FLIGHT = int(os.environ.get("SESSION_MAX_IN_FLIGHT", 2))
+    # GROQ requests one session may have running or queued, across all its questions
+    LLM_SESSION_MAX_SLOTS = int(os.environ.get("LLM_SESSION_MAX_SLOTS", max(1, LLM_MAX_CONCURRENT // 2)))
+    
+    # Admin endpoints require this token and are disabled without one
+    ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+    
+    # Connections kept open to upstream services per worker, shared by all threads
+    HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 32))
+    
+    # Structured lookup settings
+    STRUCTURED_LOOKUP_ENABLED = os.environ.get("STRUCTURED_LOOKUP_ENABLED", "true").lower() == "true"
+    STRUCTURED_LOOKUP_MIN_CONFIDENCE = float(os.environ.get("STRUCTURED_LOOKUP_MIN_CONFIDENCE", 0.6))
+    
+    # Extractive answer settings
+    EXTRACTIVE_ENABLED = os.environ.get("EXTRACTIVE_ENABLED", "true").lower() == "true"
+    EXTRACTIVE_MIN_CONFIDENCE = float(os.environ.get("EXTRACTIVE_MIN_CONFIDENCE", 0.8))
+    EXTRACTIVE_MIN_MARGIN = float(os.environ.get("EXTRACTIVE_MIN_MARGIN", 0.15))
+    EXTRACTIVE_MAX_QUESTION_TERMS = int(os.environ.get("EXTRACTIVE_MAX_QUESTION_TERMS", 10))
+    EXTRACTIVE_MAX_SENTENCE_CHARS = int(os.environ.get("EXTRACTIVE_MAX_SENTENCE_CHARS", 400))
+    # Terms an answer sentence needs besides the question's own
+    EXTRACTIVE_MIN_ANSWER_TERMS = int(os.environ.get("EXTRACTIVE_MIN_ANSWER_TERMS", 2))
+    EXTRACTIVE_LLM_FOLLOWUP = os.environ.get("EXTRACTIVE_LLM_FOLLOWUP", "false").lower() == "true"
+    
+    # Batch question settings (/chat/ask-batch)
+    BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", 50))
+    BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", 4))
+    BATCH_DEADLINE_SECONDS = float(os.environ.get("BATCH_DEADLINE_SECONDS", 300))
+    
+    # Bulk ingestion settings (flask ingest)
+    INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 4))
+    INGEST_REPORT_INTERVAL = float(os.environ.get("INGEST_REPORT_INTERVAL", 10))
+    
+    # Ingestion progress pushed over server-sent events (/documents/events)
+    PROGRESS_HISTORY = int(os.environ.get("PROGRESS_HISTORY", 100))  # events kept per session for reconnects
+    PROGRESS_HEARTBEAT_SECONDS = float(os.environ.get("PROGRESS_HEARTBEAT_SECONDS", 15))
+    PROGRESS_STREAM_MAX_SECONDS = float(os.environ.get("PROGRESS_STREAM_MAX_SECONDS", 300))
+    # Documents processed by another worker process are re-checked in the database at this interval
+    PROGRESS_FALLBACK_SECONDS = float(os.environ.get("PROGRESS_FALLBACK_SECONDS", 15))
+    
+    # Request tracing settings
+    TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "true").lower() == "true"
+    TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 1.0))
+    TRACE_FILE = os.environ.get("TRACE_FILE", "logs/traces.jsonl")  # one file per worker (pid added); empty to keep traces in memory only
+    TRACE_FILE_MAX_BYTES = int(os.environ.get("TRACE_FILE_MAX_BYTES", 10485760))
+    TRACE_FILE_BACKUP_COUNT = int(os.environ.get("TRACE_FILE_BACKUP_COUNT", 5))
+    TRACE_RECENT_LIMIT = int(os.environ.get("TRACE_RECENT_LIMIT", 500))
+    TRACE_DB_STATEMENT_CHARS = int(os.environ.get("TRACE_DB_STATEMENT_CHARS", 200))
+    
+    # GROQ pricing used for cost estimates, in USD per million tokens
+    GROQ_INPUT_PRICE_PER_M = float(os.environ.get("GROQ_INPUT_PRICE_PER_M", 0.05))
+    GROQ_OUTPUT_PRICE_PER_M = float(os.environ.get("GROQ_OUTPUT_PRICE_PER_M", 0.08))
+    
+    # Request deadlines and upstream timeouts, in seconds
+    ASK_DEADLINE_SECONDS = float(os.environ.get("ASK_DEADLINE_SECONDS", 30))
+    UPLOAD_DEADLINE_SECONDS = float(os.environ.get("UPLOAD_DEADLINE_SECONDS", 110))
+    GROQ_TIMEOUT = float(os.environ.get("GROQ_TIMEOUT", 30))
+    
+    # Hedged GROQ requests: a second attempt starts once the first is slower than the recent p95
+    GROQ_HEDGE_ENABLED = os.environ.get("GROQ_HEDGE_ENABLED", "false").lower() == "true"
+    GROQ_HEDGE_MIN_SAMPLES = int(os.environ.get("GROQ_HEDGE_MIN_SAMPLES", 20))
+    
+    # Payload optimization before sending files to Document Intelligence (needs Pillow, and pypdf for PDFs)
+    PAYLOAD_OPTIMIZATION_ENABLED = os.environ.get("PAYLOAD_OPTIMIZATION_ENABLED", "true").lower() == "true"
+    PAYLOAD_MIN_SAVINGS_RATIO = float(os.environ.get("PAYLOAD_MIN_SAVINGS_RATIO", 0.1))
+    IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", 3000))
+    IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", 85))
+    IMAGE_GRAYSCALE = os.environ.get("IMAGE_GRAYSCALE", "false").lower() == "true"
+    PDF_IMAGE_MAX_DIMENSION = int(os.environ.get("PDF_IMAGE_MAX_DIMENSION", 2000))
+    PDF_DROP_BLANK_PAGES = os.environ.get("PDF_DROP_BLANK_PAGES", "false").lower() == "true"
@@ -0,0 +1,15 @@
+import multiprocessing
+import os
+
+# Gunicorn settings. Questions and uploads spend nearly all their time waiting on
+# GROQ and Azure, so each worker serves many requests concurrently on threads
+# ("gthread", the default here) or greenlets ("gevent", needs the gevent package).
+# Set GUNICORN_WORKER_CLASS=sync to get the old one-request-per-process behaviour.
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+# Gunicorn silently switches sync workers to gthread when threads > 1
+threads = 1 if worker_class == "sync" else int(os.environ.get("GUNICORN_THREADS", 32))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))  # gevent only
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+keepalive = 5
@@ -1,6 +1,7 @@
 from app import db
 from datetime import datetime
 from sqlalchemy import Text
+from sqlalchemy.orm import deferred
 
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -8,6 +9,7 @@ class Document(db.Model):
     original_filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.Integer, nullable=False)
+    transfer_bytes = db.Column(db.Integer)  # bytes sent to Document Intelligence after optimization
     mime_type = db.Column(db.String(100), nullable=False)
     status = db.Column(db.String(50), default='uploaded')  # uploaded, processing, indexed, error
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -15,6 +17,11 @@ class Document(db.Model):
     session_id = db.Column(db.String(100), nullable=False)
     total_chunks = db.Column(db.Integer, default=0)
     error_message = db.Column(Text)
+    page_count = db.Column(db.Integer, default=1)
+    content = deferred(db.Column(Text))  # extracted text, loaded only when needed
+    summary = db.Column(Text)  # generated in the background after extraction
+    block_signatures = deferred(db.Column(Text))  # packed MinHash signatures, one per passage
+    current_version_id = db.Column(db.Integer)  # DocumentVersion the content was built from
     
     def __repr__(self):
         return f'<Document {self.original_filename}>'
@@ -33,6 +40,54 @@ class DocumentChunk(db.Model):
     def __repr__(self):
         return f'<DocumentChunk {self.azure_search_id}>'
 
+class ExtractedTable(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False, index=True)
+    table_index = db.Column(db.Integer, nullable=False)
+    page_number = db.Column(db.Integer)
+    row_count = db.Column(db.Integer, default=0)
+    headers = db.Column(Text)  # JSON list of column headers
+    columns = db.Column(Text)  # JSON list of columns, each a list of cell values by row
+    
+    def __repr__(self):
+        return f'<ExtractedTable {self.document_id}:{self.table_index}>'
+
+class KeyValuePair(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False, index=True)
+    key = db.Column(Text, nullable=False)
+    normalized_key = db.Column(db.String(255), nullable=False, index=True)
+    value = db.Column(Text, nullable=False)
+    page_number = db.Column(db.Integer)
+    confidence = db.Column(db.Float)
+    
+    def __repr__(self):
+        return f'<KeyValuePair {self.normalized_key}>'
+
+class DocumentVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False, index=True)
+    version_number = db.Column(db.Integer, nullable=False)
+    file_hash = db.Column(db.String(64), nullable=False)
+    file_size = db.Column(db.Integer)
+    page_count = db.Column(db.Integer, default=0)
+    pages_analyzed = db.Column(db.Integer, default=0)  # pages sent to Document Intelligence
+    pages_reused = db.Column(db.Integer, default=0)  # pages copied from the previous version
+    created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DocumentVersion {self.document_id} v{self.version_number}>'
+
+class DocumentPage(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version_id = db.Column(db.Integer, db.ForeignKey('document_version.id'), nullable=False, index=True)
+    page_number = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    extraction = db.Column(Text)  # JSON of the page's text, tables and key-value pairs
+    
+    def __repr__(self):
+        return f'<DocumentPage {self.version_id}:{self.page_number}>'
+
 class ChatSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(100), nullable=False, index=True)
@@ -49,5 +104,16 @@ class ChatMessage(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     sources = db.Column(Text)  # JSON string of source documents
     
+    # Accounting for assistant messages
+    model = db.Column(db.String(100))
+    answer_mode = db.Column(db.String(50))  # llm, map_reduce, structured_lookup, ...
+    prompt_tokens = db.Column(db.Integer)
+    completion_tokens = db.Column(db.Integer)
+    context_bytes = db.Column(db.Integer)
+    retrieval_ms = db.Column(db.Float)
+    llm_ms = db.Column(db.Float)
+    db_ms = db.Column(db.Float)
+    total_ms = db.Column(db.Float)
+    
     def __repr__(self):
         return f'<ChatMessage {self.session_id} - {self.message_type}>'
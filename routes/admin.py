@@ -0,0 +1,129 @@
+import os
+import hmac
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Blueprint, jsonify, request, render_template
+from sqlalchemy import func
+from config import Config
+from models import ChatMessage, Document
+from app import db
+from services.admission import llm_admission, document_intelligence_admission
+from services.tracing import tracer, trace_file_path
+
+admin_bp = Blueprint('admin', __name__)
+
+def admin_required(view):
+    """
+    Require the admin token; without one configured the admin endpoints don't exist
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not Config.ADMIN_TOKEN:
+            return jsonify({'error': 'Not found'}), 404
+        token = request.headers.get('X-Admin-Token') or request.args.get('token')
+        if not token or not hmac.compare_digest(token, Config.ADMIN_TOKEN):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapped
+
+@admin_bp.route('/admission')
+@admin_required
+def admission_stats():
+    return jsonify({
+        'llm': llm_admission.stats(),
+        'document_intelligence': document_intelligence_admission.stats()
+    })
+
+@admin_bp.route('/usage')
+@admin_required
+def usage_rollup():
+    """
+    Token, latency and cost totals of assistant messages per session or per day
+    """
+    group_by = request.args.get('group_by', 'session')
+    days = request.args.get('days', 7, type=int)
+    limit = request.args.get('limit', 50, type=int)
+    
+    if group_by == 'day':
+        group_column = func.date(ChatMessage.timestamp)
+    elif group_by == 'session':
+        group_column = ChatMessage.session_id
+    else:
+        return jsonify({'error': 'group_by must be "session" or "day"'}), 400
+    
+    prompt_tokens = func.coalesce(func.sum(ChatMessage.prompt_tokens), 0)
+    completion_tokens = func.coalesce(func.sum(ChatMessage.completion_tokens), 0)
+    
+    rows = db.session.query(
+        group_column.label('group'),
+        func.count(ChatMessage.id),
+        prompt_tokens,
+        completion_tokens,
+        func.coalesce(func.sum(ChatMessage.context_bytes), 0),
+        func.avg(ChatMessage.retrieval_ms),
+        func.avg(ChatMessage.llm_ms),
+        func.avg(ChatMessage.db_ms),
+        func.avg(ChatMessage.total_ms),
+        func.max(ChatMessage.total_ms)
+    ).filter(
+        ChatMessage.message_type == 'assistant',
+        ChatMessage.timestamp >= datetime.utcnow() - timedelta(days=days)
+    ).group_by(group_column).order_by(
+        (prompt_tokens + completion_tokens).desc()
+    ).limit(limit).all()
+    
+    rollup = []
+    for row in rows:
+        cost = (row[2] * Config.GROQ_INPUT_PRICE_PER_M + row[3] * Config.GROQ_OUTPUT_PRICE_PER_M) / 1_000_000
+        rollup.append({
+            group_by: str(row[0]),
+            'answers': row[1],
+            'prompt_tokens': row[2],
+            'completion_tokens': row[3],
+            'context_bytes': row[4],
+            'avg_retrieval_ms': round(row[5] or 0, 1),
+            'avg_llm_ms': round(row[6] or 0, 1),
+            'avg_db_ms': round(row[7] or 0, 1),
+            'avg_total_ms': round(row[8] or 0, 1),
+            'max_total_ms': round(row[9] or 0, 1),
+            'estimated_cost_usd': round(cost, 6)
+        })
+    
+    return jsonify({'group_by': group_by, 'days': days, 'rollup': rollup})
+
+@admin_bp.route('/payload')
+@admin_required
+def payload_savings():
+    """
+    Bytes uploaded versus bytes sent to Document Intelligence
+    """
+    count, original_bytes, transfer_bytes = db.session.query(
+        func.count(Document.id),
+        func.coalesce(func.sum(Document.file_size), 0),
+        func.coalesce(func.sum(Document.transfer_bytes), 0)
+    ).filter(Document.transfer_bytes.isnot(None)).one()
+    
+    return jsonify({
+        'documents': count,
+        'original_bytes': original_bytes,
+        'transfer_bytes': transfer_bytes,
+        'bytes_saved': original_bytes - transfer_bytes,
+        'savings_ratio': round(1 - transfer_bytes / original_bytes, 3) if original_bytes else 0.0
+    })
+
+@admin_bp.route('/traces')
+@admin_required
+def slowest_traces():
+    """
+    The slowest recent request traces with their spans. Traces are kept per
+    worker process, so these are the ones of the worker answering this request.
+    """
+    limit = request.args.get('limit', 20, type=int)
+    traces = tracer.slowest(limit)
+    process_id = os.getpid()
+    trace_file = trace_file_path(process_id) if Config.TRACE_FILE else None
+    
+    if request.args.get('format') == 'json':
+        return jsonify({'process_id': process_id, 'trace_file': trace_file, 'traces': traces})
+    return render_template('admin_traces.html', traces=traces, token=request.args.get('token'),
+                           process_id=process_id, trace_file=trace_file)
@@ -1,12 +1,35 @@
 from flask import Blueprint, render_template, request, jsonify, session, flash, redirect, url_for
+from flask import Response, stream_with_context
 from models import Document, ChatMessage
 from services.document_processor import DocumentProcessor
+from services.admission import llm_admission, AdmissionRejected
+from services.deadline import Deadline, DeadlineExceeded
+from services.tracing import bind_context
+from config import Config
 from app import db
 import uuid
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 
 chat_bp = Blueprint('chat', __name__)
 
+def record_accounting(message, result):
+    """
+    Copy token usage, context size and stage timings of an answer onto its message
+    """
+    usage = result.get('usage', {})
+    timings = result.get('timings', {})
+    message.model = usage.get('model')
+    message.answer_mode = result.get('mode', 'llm')
+    message.prompt_tokens = usage.get('prompt_tokens', 0)
+    message.completion_tokens = usage.get('completion_tokens', 0)
+    message.context_bytes = result.get('context_bytes', 0)
+    message.retrieval_ms = timings.get('retrieval_ms')
+    message.llm_ms = timings.get('llm_ms')
+    message.db_ms = timings.get('db_ms')
+    message.total_ms = timings.get('total_ms')
+
 @chat_bp.route('/')
 def chat_interface():
     # Ensure user has a session ID
@@ -34,6 +57,7 @@ def ask_question():
         return jsonify({'error': 'No session'}), 400
     
     session_id = session['session_id']
+    deadline = Deadline(Config.ASK_DEADLINE_SECONDS)
     
     try:
         data = request.get_json()
@@ -57,21 +81,33 @@ def ask_question():
                 'context_used': 0
             })
         
-        # Save user message
-        user_message = ChatMessage()
-        user_message.session_id = session_id
-        user_message.message_type = 'user'
-        user_message.content = question
-        db.session.add(user_message)
+        asked_at = datetime.utcnow()
+        
+        # The client asks for the LLM answer after showing an extractive one
+        llm_followup = bool(data.get('llm_followup'))
         
         # Get document filters if specified
         document_filters = None
         if 'document_names' in data and data['document_names']:
             document_filters = {'document_names': data['document_names']}
         
-        # Process the question
-        processor = DocumentProcessor()
-        result = processor.search_and_answer(question, session_id, document_filters)
+        # Count the question against the session's fair share; each GROQ call waits for capacity
+        # on its own, so lookups answered without the LLM never queue behind it
+        with llm_admission.session(session_id):
+            processor = DocumentProcessor()
+            result = processor.search_and_answer(
+                question, session_id, document_filters, deadline, fast_path=not llm_followup
+            )
+        
+        # Save user message, after the answer so no transaction is held open while the LLM runs.
+        # A follow-up answers a question that was already saved.
+        if not llm_followup:
+            user_message = ChatMessage()
+            user_message.session_id = session_id
+            user_message.message_type = 'user'
+            user_message.content = question
+            user_message.timestamp = asked_at
+            db.session.add(user_message)
         
         # Save assistant message
         assistant_message = ChatMessage()
@@ -79,15 +115,157 @@ def ask_question():
         assistant_message.message_type = 'assistant'
         assistant_message.content = result['response']
         assistant_message.sources = json.dumps(result['sources'])
+        record_accounting(assistant_message, result)
         db.session.add(assistant_message)
         db.session.commit()
         
         return jsonify(result)
         
+    except AdmissionRejected as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status_code, {'Retry-After': str(e.retry_after)}
+    except DeadlineExceeded as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 504
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Error processing question: {str(e)}'}), 500
 
+@chat_bp.route('/ask-batch', methods=['POST'])
+def ask_batch():
+    """
+    Answer a list of questions over the same documents. The context is loaded
+    once, questions are answered concurrently and each result is streamed as
+    one line of NDJSON as soon as it is ready. All messages are saved together
+    at the end. The whole batch counts as one request against the session's
+    fair share of the LLM, and every GROQ call it makes is charged to the
+    session's share of the slots, so a batch never holds more LLM capacity
+    than one session may.
+    """
+    if 'session_id' not in session:
+        return jsonify({'error': 'No session'}), 400
+    
+    session_id = session['session_id']
+    deadline = Deadline(Config.BATCH_DEADLINE_SECONDS)
+    
+    data = request.get_json(silent=True) or {}
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions:
+        return jsonify({'error': 'No questions provided'}), 400
+    if len(questions) > Config.BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'At most {Config.BATCH_MAX_QUESTIONS} questions per batch'}), 400
+    questions = [str(question).strip() for question in questions]
+    if not all(questions):
+        return jsonify({'error': 'Empty question'}), 400
+    
+    document_filters = None
+    if data.get('document_names'):
+        document_filters = {'document_names': data['document_names']}
+    
+    try:
+        release_session = llm_admission.hold_session(session_id)
+    except AdmissionRejected as e:
+        return jsonify({'error': str(e)}), e.status_code, {'Retry-After': str(e.retry_after)}
+    
+    try:
+        processor = DocumentProcessor()
+        prepared = processor.prepare_batch(questions, session_id, document_filters)
+    except Exception as e:
+        db.session.rollback()
+        release_session()
+        return jsonify({'error': f'Error preparing documents: {str(e)}'}), 500
+    
+    if prepared is None:
+        release_session()
+        return jsonify({'error': 'Please upload and process some documents first before asking questions.'}), 400
+    
+    asked_at = datetime.utcnow()
+    
+    def answer(index):
+        # Each GROQ call of a worker takes its own slot, out of the session's share
+        try:
+            with llm_admission.charge_to(session_id):
+                return index, processor.answer_prepared(questions[index], prepared, deadline)
+        except AdmissionRejected as e:
+            return index, {'error': str(e), 'retry_after': e.retry_after}
+        except Exception as e:
+            return index, {'error': f'Error processing question: {str(e)}'}
+    
+    def generate():
+        results = dict(prepared['answers'])
+        futures = []
+        try:
+            for index, result in results.items():
+                yield json.dumps({'index': index, 'question': questions[index], **result}) + "\n"
+            
+            pending = [index for index in range(len(questions)) if index not in results]
+            # More workers than the session has slots would only wait on each other
+            workers = min(Config.BATCH_MAX_WORKERS, llm_admission.per_session_slots or Config.BATCH_MAX_WORKERS)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(bind_context(answer), index) for index in pending]
+                for future in as_completed(futures):
+                    index, result = future.result()
+                    results[index] = result
+                    yield json.dumps({'index': index, 'question': questions[index], **result}) + "\n"
+        finally:
+            # Leaving the executor waited for every worker, so answers finished after the
+            # client went away are collected too; they were paid for
+            for future in futures:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    index, result = future.result()
+                    results.setdefault(index, result)
+            
+            # One transaction for the whole batch, in question order, even if the client went away
+            saved = save_batch_messages(session_id, questions, results, asked_at)
+        
+        yield json.dumps({
+            'done': True,
+            'answered': sum(1 for result in results.values() if 'error' not in result),
+            'failed': sum(1 for result in results.values() if 'error' in result),
+            'saved_messages': saved,
+            'prepare_ms': prepared['prepare_ms']
+        }) + "\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Released once the stream ends, however it ends
+    response.call_on_close(release_session)
+    return response
+
+def save_batch_messages(session_id, questions, results, asked_at):
+    """
+    Save the answered questions of a batch and their answers in one transaction
+    """
+    saved = 0
+    try:
+        for index in sorted(results):
+            result = results[index]
+            if 'error' in result:
+                continue
+            
+            # Keep each question directly before its answer in the history
+            user_message = ChatMessage()
+            user_message.session_id = session_id
+            user_message.message_type = 'user'
+            user_message.content = questions[index]
+            user_message.timestamp = asked_at + timedelta(microseconds=2 * index)
+            db.session.add(user_message)
+            
+            assistant_message = ChatMessage()
+            assistant_message.session_id = session_id
+            assistant_message.message_type = 'assistant'
+            assistant_message.content = result['response']
+            assistant_message.sources = json.dumps(result['sources'])
+            assistant_message.timestamp = asked_at + timedelta(microseconds=2 * index + 1)
+            record_accounting(assistant_message, result)
+            db.session.add(assistant_message)
+            saved += 2
+        
+        db.session.commit()
+        return saved
+    except Exception:
+        db.session.rollback()
+        raise
+
 @chat_bp.route('/clear', methods=['POST'])
 def clear_chat():
     if 'session_id' not in session:
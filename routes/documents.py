@@ -1,8 +1,16 @@
 import os
+import json
+import time
 from flask import Blueprint, request, render_template, jsonify, session, flash, redirect, url_for
+from flask import Response, stream_with_context
 from werkzeug.utils import secure_filename
 from models import Document
 from services.document_processor import DocumentProcessor
+from services.admission import document_intelligence_admission, AdmissionRejected
+from services.deadline import Deadline
+from services.progress import progress_broker
+from config import Config
+from app import db
 import uuid
 
 documents_bp = Blueprint('documents', __name__)
@@ -29,6 +37,7 @@ def upload_file():
         session['session_id'] = str(uuid.uuid4())
     
     session_id = session['session_id']
+    deadline = Deadline(Config.UPLOAD_DEADLINE_SECONDS)
     
     try:
         if 'file' not in request.files:
@@ -54,13 +63,19 @@ def upload_file():
             flash('File too large. Maximum size: 10MB', 'error')
             return redirect(url_for('main.index'))
         
-        # Process the document
-        processor = DocumentProcessor()
-        document = processor.process_uploaded_file(file, session_id)
+        # Process the document once Document Intelligence has capacity for it
+        with document_intelligence_admission.admit(session_id, timeout=deadline.timeout(Config.DI_QUEUE_TIMEOUT)):
+            processor = DocumentProcessor()
+            document = processor.process_uploaded_file(file, session_id, deadline)
         
         flash(f'Document "{document.original_filename}" uploaded and processed successfully!', 'success')
         return redirect(url_for('documents.list_documents'))
         
+    except AdmissionRejected as e:
+        flash(f'{str(e)} (retry in {e.retry_after} seconds)', 'error')
+        response = redirect(url_for('main.index'))
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
     except Exception as e:
         flash(f'Error processing document: {str(e)}', 'error')
         return redirect(url_for('main.index'))
@@ -99,3 +114,91 @@ def document_status(document_id):
         'total_chunks': document.total_chunks,
         'error_message': document.error_message
     })
+
+@documents_bp.route('/events')
+def document_events():
+    """
+    Server-sent events with the processing progress of all of the session's
+    documents. Stage changes are pushed as they happen; the database is only
+    read once per connection for a snapshot, and for documents that another
+    worker process is handling, which this process can't hear about.
+    """
+    if 'session_id' not in session:
+        return jsonify({'error': 'No session'}), 400
+    
+    session_id = session['session_id']
+    last_event_id = progress_broker.parse_event_id(session_id, request.headers.get('Last-Event-ID'))
+    
+    def snapshot():
+        rows = db.session.query(Document.id, Document.status, Document.error_message).filter_by(
+            session_id=session_id
+        ).all()
+        # Give the connection back to the pool for the rest of the stream
+        db.session.commit()
+        return {row.id: (row.status, row.error_message) for row in rows}
+    
+    def format_event(sequence, payload):
+        return f"id: {progress_broker.event_id(sequence)}\nevent: progress\ndata: {json.dumps(payload)}\n\n"
+    
+    def status_event(document_id, status, error_message):
+        return {
+            'document_id': document_id,
+            'status': status,
+            'stage': status,
+            'message': error_message if status == 'error' else None
+        }
+    
+    def generate():
+        after = last_event_id
+        # A reconnect to the process that issued its last event resumes from the events it
+        # missed; anything else (new connection, another worker, a restart) starts from a snapshot
+        if after is None:
+            after = progress_broker.latest_id()
+            statuses = snapshot()
+            yield f"retry: {int(Config.PROGRESS_HEARTBEAT_SECONDS * 1000)}\n\n"
+            for document_id, (status, error_message) in statuses.items():
+                yield format_event(after, status_event(document_id, status, error_message))
+        else:
+            statuses = snapshot()
+        
+        # Documents still processing that no event will arrive for here
+        unobserved = {
+            document_id for document_id, (status, _) in statuses.items()
+            if status == 'processing' and not progress_broker.is_tracked(document_id)
+        }
+        
+        started = time.monotonic()
+        next_fallback = started + Config.PROGRESS_FALLBACK_SECONDS
+        while time.monotonic() - started < Config.PROGRESS_STREAM_MAX_SECONDS:
+            timeout = Config.PROGRESS_HEARTBEAT_SECONDS
+            if unobserved:
+                timeout = min(timeout, max(next_fallback - time.monotonic(), 0))
+            
+            events = progress_broker.wait(session_id, after, timeout)
+            for event in events:
+                after = event['id']
+                unobserved.discard(event['document_id'])
+                yield format_event(event['id'], {key: value for key, value in event.items() if key != 'id'})
+            
+            if unobserved and time.monotonic() >= next_fallback:
+                rows = db.session.query(Document.id, Document.status, Document.error_message).filter(
+                    Document.id.in_(unobserved)
+                ).all()
+                db.session.commit()
+                for row in rows:
+                    if row.status != 'processing':
+                        unobserved.discard(row.id)
+                        yield format_event(after, status_event(row.id, row.status, row.error_message))
+                unobserved &= {row.id for row in rows}
+                next_fallback = time.monotonic() + Config.PROGRESS_FALLBACK_SECONDS
+            
+            if not events:
+                # Keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+        # The browser reconnects with Last-Event-ID, which also frees the worker thread periodically
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,136 @@
+"""
+Concurrent load test for /chat/ask.
+
+Each virtual user gets its own session (optionally uploading a document first)
+and asks questions back to back, so the number of in-flight questions equals
+the number of users. Compare serving modes by running it against the server
+started with GUNICORN_WORKER_CLASS=sync (one thread per worker) and then with
+the default gthread, keeping GUNICORN_WORKERS the same for both runs:
+
+    python scripts/load_test.py --url http://localhost:5000 --users 64 --questions 5 --upload sample.pdf
+
+Without Azure and GROQ, run the server against scripts/stub_groq.py and use
+--seed, which stores an indexed document for each user directly in the
+server's database (same DATABASE_URL and FLASK_SECRET_KEY) and signs a session
+cookie for it. --stub-url reports how many questions were really in flight at
+once on the server, as seen by the stub:
+
+    python scripts/load_test.py --users 64 --questions 5 --seed --stub-url http://127.0.0.1:8100
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+SEED_CONTENT = """--- Page 1 ---
+Load test document. The quarterly report covers revenue, hiring and the product roadmap.
+Revenue grew in every region, hiring slowed in the second half and two products launched.
+"""
+
+in_flight = 0
+peak_in_flight = 0
+lock = threading.Lock()
+
+def seed_sessions(count):
+    """
+    Store an indexed document for each of count new sessions and return their session cookies
+    """
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app, db
+    from models import Document
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookies = []
+    with app.app_context():
+        for _ in range(count):
+            session_id = str(uuid.uuid4())
+            document = Document()
+            document.filename = document.original_filename = document.file_path = "load_test.txt"
+            document.file_size = len(SEED_CONTENT)
+            document.mime_type = 'text/plain'
+            document.status = 'indexed'
+            document.session_id = session_id
+            document.content = SEED_CONTENT
+            db.session.add(document)
+            cookies.append(serializer.dumps({'session_id': session_id}))
+        db.session.commit()
+    return app.config['SESSION_COOKIE_NAME'], cookies
+
+def run_user(args, user_index):
+    global in_flight, peak_in_flight
+    session = requests.Session()
+    if args.cookies:
+        cookie_name, cookies = args.cookies
+        session.cookies.set(cookie_name, cookies[user_index])
+    session.get(f"{args.url}/", timeout=30)
+
+    if args.upload:
+        with open(args.upload, 'rb') as file:
+            session.post(
+                f"{args.url}/documents/upload",
+                files={'file': (os.path.basename(args.upload), file)},
+                timeout=300
+            )
+
+    results = []
+    for _ in range(args.questions):
+        with lock:
+            in_flight += 1
+            peak_in_flight = max(peak_in_flight, in_flight)
+
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{args.url}/chat/ask", json={'question': args.question}, timeout=120)
+            status = response.status_code
+        except requests.RequestException:
+            status = 'error'
+        finally:
+            with lock:
+                in_flight -= 1
+
+        results.append((status, time.perf_counter() - started))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--users', type=int, default=32, help='concurrent virtual users')
+    parser.add_argument('--questions', type=int, default=5, help='questions per user')
+    parser.add_argument('--question', default='What are the main topics covered in the documents?')
+    parser.add_argument('--upload', help='document each user uploads before asking')
+    parser.add_argument('--seed', action='store_true', help='seed a document per user in the database instead of uploading')
+    parser.add_argument('--stub-url', help='scripts/stub_groq.py to read the server-side concurrency from')
+    args = parser.parse_args()
+    args.cookies = seed_sessions(args.users) if args.seed else None
+    if args.stub_url:
+        requests.delete(args.stub_url, timeout=10)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        per_user = list(executor.map(lambda index: run_user(args, index), range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    results = [result for user_results in per_user for result in user_results]
+    latencies = sorted(latency for status, latency in results if status == 200)
+    statuses = {}
+    for status, latency in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f"Requests:        {len(results)} in {elapsed:.1f} s ({len(results) / elapsed:.2f} req/s)")
+    print(f"Peak in flight:  {peak_in_flight} sent by this client")
+    if args.stub_url:
+        stats = requests.get(args.stub_url, timeout=10).json()
+        print(f"Peak at GROQ:    {stats['peak_in_flight']} questions answered concurrently ({stats['completions']} calls)")
+    print(f"Status codes:    {statuses}")
+    if latencies:
+        print(f"Latency p50:     {statistics.median(latencies):.2f} s")
+        print(f"Latency p95:     {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.2f} s")
+
+if __name__ == '__main__':
+    main()
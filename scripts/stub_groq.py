@@ -0,0 +1,83 @@
+"""
+Stand-in for the GROQ chat completions API, for load tests without GROQ.
+
+Answers every completion after a fixed delay, like a model of steady latency,
+and reports the peak number of concurrent requests it saw. Point the server at
+it with GROQ_BASE_URL:
+
+    python scripts/stub_groq.py --port 8100 --delay 1.0
+    GROQ_BASE_URL=http://127.0.0.1:8100 GROQ_API_KEY=stub gunicorn --config gunicorn.conf.py main:app
+
+Questions never call Azure, but AZURE_DI_ENDPOINT and AZURE_DI_KEY must be set
+(to anything) since the document processor builds its client up front.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+in_flight = 0
+peak_in_flight = 0
+completions = 0
+lock = threading.Lock()
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 1.0
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        global in_flight, peak_in_flight, completions
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        with lock:
+            in_flight += 1
+            peak_in_flight = max(peak_in_flight, in_flight)
+        try:
+            time.sleep(self.delay)
+            self._send({
+                'model': 'stub',
+                'choices': [{'message': {'role': 'assistant', 'content': 'Stub answer [Document: stub.txt, Page: 1].'}}],
+                'usage': {'prompt_tokens': 100, 'completion_tokens': 10}
+            })
+        finally:
+            with lock:
+                in_flight -= 1
+                completions += 1
+
+    def do_GET(self):
+        # Any GET reports the load seen so far; DELETE clears it
+        with lock:
+            self._send({'in_flight': in_flight, 'peak_in_flight': peak_in_flight, 'completions': completions})
+
+    def do_DELETE(self):
+        global peak_in_flight, completions
+        with lock:
+            peak_in_flight = in_flight
+            completions = 0
+        self._send({'reset': True})
+
+    def _send(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--delay', type=float, default=1.0, help='seconds per completion')
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"Stub GROQ API on http://127.0.0.1:{args.port} ({args.delay:g} s per completion)")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
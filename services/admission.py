@@ -0,0 +1,285 @@
+import math
+import time
+import logging
+import threading
+import contextvars
+from collections import Counter, deque
+from contextlib import contextmanager
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Session whose share of the upstream slots the calls of the current request are charged to
+_current_session = contextvars.ContextVar('admission_session', default=None)
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request can't be admitted; carries the HTTP status and Retry-After seconds
+    """
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Bounded concurrency for one upstream service within a worker process.
+    Calls beyond the limit wait in a short FIFO queue until their deadline;
+    when the queue is full, or a session already has its fair share in flight,
+    they are rejected immediately instead of piling up behind slow calls.
+    Requests that fan out into several upstream calls count against their
+    session once with session() and take a slot per call with admit().
+    Each call is charged to the session bound with charge_to(), which holds at
+    most per_session_slots slots (running or queued); its further calls wait
+    for its own calls to finish, so one session never fills the capacity.
+    """
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout, per_session_limit,
+                 per_session_slots=None):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.per_session_limit = per_session_limit
+        self.per_session_slots = per_session_slots
+        
+        self._condition = threading.Condition()
+        self._active = 0
+        self._queue = deque()
+        self._per_session = Counter()
+        self._session_slots = Counter()
+        self._service_time = 1.0  # moving average of seconds per admitted request
+        
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_session_limit = 0
+        self.timed_out = 0
+        self.peak_queue_depth = 0
+    
+    @contextmanager
+    def admit(self, session_id=None, timeout=None):
+        """
+        Hold one slot for the duration of the block
+        """
+        release = self.acquire(session_id, timeout)
+        try:
+            yield
+        finally:
+            release()
+    
+    def acquire(self, session_id=None, timeout=None, session_timeout=None):
+        """
+        Take one slot and return the function that releases it, for slots
+        released on another thread than the one that took them. Waiting for the
+        session's own calls to free its share is bounded by session_timeout
+        (default: timeout), waiting for capacity by timeout.
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        owner = session_id if session_id is not None else _current_session.get()
+        self._acquire(session_id, owner, timeout, timeout if session_timeout is None else session_timeout)
+        return self._releaser(session_id, owner)
+    
+    def try_acquire(self):
+        """
+        Take a free slot without queueing; returns its release function, or None when there is none
+        """
+        owner = _current_session.get()
+        with self._condition:
+            if self._active >= self.max_concurrent or self._queue or not self._has_share(owner):
+                return None
+            self._active += 1
+            self._count_slots(owner, 1)
+            self.admitted += 1
+        return self._releaser(None, owner)
+    
+    def _releaser(self, session_id, owner):
+        started = time.monotonic()
+        released = []
+        
+        def release():
+            if not released:
+                released.append(True)
+                self._release(session_id, owner, time.monotonic() - started)
+        return release
+    
+    @contextmanager
+    def charge_to(self, session_id):
+        """
+        Charge the slots taken in the block, including on threads started with
+        bind_context(), to the session's share
+        """
+        token = _current_session.set(session_id)
+        try:
+            yield
+        finally:
+            _current_session.reset(token)
+    
+    @contextmanager
+    def session(self, session_id):
+        """
+        Count one request against the session's fair share for the duration of
+        the block, without holding a slot; its upstream calls are admitted one by
+        one and charged to the session's share of the slots
+        """
+        release = self.hold_session(session_id)
+        try:
+            with self.charge_to(session_id):
+                yield
+        finally:
+            release()
+    
+    def hold_session(self, session_id):
+        """
+        Count one request against the session's fair share until the returned function is called
+        """
+        with self._condition:
+            self._check_session(session_id)
+            self._count_session(session_id, 1)
+        released = []
+        
+        def release():
+            if not released:
+                released.append(True)
+                with self._condition:
+                    self._count_session(session_id, -1)
+        return release
+    
+    def _check_session(self, session_id):
+        if session_id is not None and self._per_session[session_id] >= self.per_session_limit:
+            self.rejected_session_limit += 1
+            raise AdmissionRejected(
+                "Too many requests in progress for this session. Please wait for them to finish.",
+                429, self._retry_after()
+            )
+    
+    def _has_share(self, owner):
+        return owner is None or self.per_session_slots is None or self._session_slots[owner] < self.per_session_slots
+    
+    def _wait_for_share(self, owner, timeout):
+        """
+        Wait until the session holds fewer than its share of slots; only its own calls free them
+        """
+        deadline = time.monotonic() + timeout
+        while not self._has_share(owner):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.rejected_session_limit += 1
+                raise AdmissionRejected(
+                    "Too many requests in progress for this session. Please wait for them to finish.",
+                    429, self._retry_after()
+                )
+            self._condition.wait(remaining)
+    
+    def _acquire(self, session_id, owner, timeout, session_timeout):
+        with self._condition:
+            self._wait_for_share(owner, session_timeout)
+            self._check_session(session_id)
+            
+            if self._active < self.max_concurrent and not self._queue:
+                self._active += 1
+                self._count_session(session_id, 1)
+                self._count_slots(owner, 1)
+                self.admitted += 1
+                return
+            
+            if len(self._queue) >= self.max_queue:
+                self.rejected_queue_full += 1
+                logger.warning(f"{self.name} admission queue full ({len(self._queue)} waiting)")
+                raise AdmissionRejected("The server is busy. Please try again shortly.", 503, self._retry_after())
+            
+            ticket = object()
+            self._queue.append(ticket)
+            self._count_session(session_id, 1)
+            self._count_slots(owner, 1)
+            self.peak_queue_depth = max(self.peak_queue_depth, len(self._queue))
+            deadline = time.monotonic() + timeout
+            
+            try:
+                while self._queue[0] is not ticket or self._active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise AdmissionRejected(
+                            "The server is busy. Please try again shortly.", 503, self._retry_after()
+                        )
+                    self._condition.wait(remaining)
+            except BaseException:
+                self._queue.remove(ticket)
+                self._count_session(session_id, -1)
+                self._count_slots(owner, -1)
+                self._condition.notify_all()
+                raise
+            
+            self._queue.popleft()
+            self._active += 1
+            self.admitted += 1
+            # The next request in line may fit as well
+            self._condition.notify_all()
+    
+    def _release(self, session_id, owner, elapsed):
+        with self._condition:
+            self._active -= 1
+            self._count_session(session_id, -1)
+            self._count_slots(owner, -1)
+            self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+            self._condition.notify_all()
+    
+    def _count_session(self, session_id, delta):
+        if session_id is None:
+            return
+        self._per_session[session_id] += delta
+        if self._per_session[session_id] <= 0:
+            del self._per_session[session_id]
+    
+    def _count_slots(self, owner, delta):
+        if owner is None:
+            return
+        self._session_slots[owner] += delta
+        if self._session_slots[owner] <= 0:
+            del self._session_slots[owner]
+    
+    def _retry_after(self):
+        """
+        Seconds until a slot is likely to free up, based on recent service times
+        """
+        backlog = len(self._queue) + 1
+        return max(1, math.ceil(self._service_time * backlog / self.max_concurrent))
+    
+    def stats(self):
+        """
+        Current load and rejection counters
+        """
+        with self._condition:
+            return {
+                'name': self.name,
+                'active': self._active,
+                'max_concurrent': self.max_concurrent,
+                'queue_depth': len(self._queue),
+                'max_queue': self.max_queue,
+                'peak_queue_depth': self.peak_queue_depth,
+                'sessions_in_flight': len(self._per_session),
+                'per_session_slots': self.per_session_slots,
+                'sessions_holding_slots': len(self._session_slots),
+                'admitted': self.admitted,
+                'rejected_queue_full': self.rejected_queue_full,
+                'rejected_session_limit': self.rejected_session_limit,
+                'timed_out': self.timed_out,
+                'avg_service_seconds': round(self._service_time, 3)
+            }
+
+# One limiter per upstream service in each worker process
+llm_admission = AdmissionController(
+    'llm',
+    max_concurrent=Config.LLM_MAX_CONCURRENT,
+    max_queue=Config.LLM_QUEUE_SIZE,
+    queue_timeout=Config.LLM_QUEUE_TIMEOUT,
+    per_session_limit=Config.SESSION_MAX_IN_FLIGHT,
+    per_session_slots=Config.LLM_SESSION_MAX_SLOTS
+)
+
+document_intelligence_admission = AdmissionController(
+    'document_intelligence',
+    max_concurrent=Config.DI_MAX_CONCURRENT,
+    max_queue=Config.DI_QUEUE_SIZE,
+    queue_timeout=Config.DI_QUEUE_TIMEOUT,
+    per_session_limit=Config.SESSION_MAX_IN_FLIGHT
+)
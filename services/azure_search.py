@@ -1,6 +1,11 @@
 import json
+import time
+import asyncio
 import logging
+import threading
+from collections import OrderedDict
 from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import SearchIndex, SimpleField, SearchableField, SearchFieldDataType
 from azure.core.credentials import AzureKeyCredential
@@ -8,6 +13,68 @@ from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Fields returned by queries; session and upload metadata are only used in filters
+RESULT_FIELDS = ["id", "content", "document_name", "page_number", "section", "chunk_index"]
+
+# Sync clients are thread-safe and shared per index; indexes known to exist aren't checked again
+_clients = {}
+_known_indexes = set()
+_clients_lock = threading.Lock()
+
+def get_shared_clients(endpoint, key, index_name):
+    """
+    Return the process-wide search and index clients for an index
+    """
+    with _clients_lock:
+        clients = _clients.get((endpoint, key, index_name))
+        if clients is None:
+            credential = AzureKeyCredential(key)
+            clients = (
+                SearchClient(endpoint=endpoint, index_name=index_name, credential=credential),
+                SearchIndexClient(endpoint=endpoint, credential=credential)
+            )
+            _clients[(endpoint, key, index_name)] = clients
+        return clients
+
+class SearchResultCache:
+    """
+    Short-lived, size-bounded cache of search results keyed by query and filter
+    """
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # Callers get their own copies to modify
+            return [dict(result) for result in entry[1]]
+    
+    def put(self, key, results):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, [dict(result) for result in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+result_cache = SearchResultCache(Config.SEARCH_CACHE_TTL_SECONDS, Config.SEARCH_CACHE_MAX_ENTRIES)
+
 class AzureSearchService:
     def __init__(self):
         self.endpoint = Config.AZURE_SEARCH_ENDPOINT
@@ -18,18 +85,12 @@ class AzureSearchService:
             raise ValueError("Azure Search credentials not configured")
         
         self.credential = AzureKeyCredential(self.key)
-        self.search_client = SearchClient(
-            endpoint=self.endpoint,
-            index_name=self.index_name,
-            credential=self.credential
-        )
-        self.index_client = SearchIndexClient(
-            endpoint=self.endpoint,
-            credential=self.credential
-        )
+        self.search_client, self.index_client = get_shared_clients(self.endpoint, self.key, self.index_name)
         
-        # Initialize index
-        self._ensure_index_exists()
+        # Initialize index once per process
+        if (self.endpoint, self.index_name) not in _known_indexes:
+            self._ensure_index_exists()
+            _known_indexes.add((self.endpoint, self.index_name))
     
     def _ensure_index_exists(self):
         """
@@ -98,6 +159,7 @@ class AzureSearchService:
                         logger.error(f"Failed to index document {item.key}: {item.error_message}")
                         raise Exception(f"Indexing failed for document {item.key}")
             
+            result_cache.clear()
             logger.info(f"Successfully indexed {len(documents)} chunks")
             return True
             
@@ -105,48 +167,22 @@ class AzureSearchService:
             logger.error(f"Error indexing documents: {str(e)}")
             raise
     
-    def search_documents(self, query, session_id=None, document_filters=None, top_k=None):
+    def search_documents(self, query, session_id=None, document_filters=None, top_k=None, include_content=True):
         """
-        Search for relevant document chunks
+        Search for relevant document chunks.
+        Only the result fields are returned, and results are cached briefly.
         """
         try:
-            top_k = top_k or Config.TOP_K_RESULTS
-            
-            # Build search parameters
-            search_params = {
-                "search_text": query,
-                "top": top_k,
-                "include_total_count": True
-            }
-            
-            # Add filters
-            filters = []
-            if session_id:
-                filters.append(f"session_id eq '{session_id}'")
-            
-            if document_filters:
-                if 'document_names' in document_filters:
-                    doc_filters = " or ".join([f"document_name eq '{name}'" for name in document_filters['document_names']])
-                    filters.append(f"({doc_filters})")
-            
-            if filters:
-                search_params["filter"] = " and ".join(filters)
+            search_params = self._search_params(query, session_id, document_filters, top_k, include_content)
+            cache_key = self._cache_key(search_params)
+            search_results = result_cache.get(cache_key)
+            if search_results is not None:
+                return search_results
             
             # Perform search
             results = self.search_client.search(**search_params)
-            
-            # Process results
-            search_results = []
-            for result in results:
-                search_results.append({
-                    "id": result["id"],
-                    "content": result["content"],
-                    "document_name": result["document_name"],
-                    "page_number": result.get("page_number", 1),
-                    "section": result.get("section", ""),
-                    "chunk_index": result["chunk_index"],
-                    "score": result.get("@search.score", 0)
-                })
+            search_results = [self._to_result(result) for result in results]
+            result_cache.put(cache_key, search_results)
             
             logger.info(f"Search returned {len(search_results)} results for query: {query}")
             return search_results
@@ -155,6 +191,118 @@ class AzureSearchService:
             logger.error(f"Error searching documents: {str(e)}")
             raise
     
+    def count_documents(self, query, session_id=None, document_filters=None):
+        """
+        Number of chunks matching a query; the total count costs extra, so it is only computed here
+        """
+        search_params = self._search_params(query, session_id, document_filters, top_k=0, include_content=False)
+        results = self.search_client.search(include_total_count=True, **search_params)
+        return results.get_count()
+    
+    def search_fanout(self, query, session_id=None, document_names=None, top_k=None, include_content=True):
+        """
+        Search each document concurrently and merge the results by score.
+        Without document names this is a single query. Must not be called
+        from a running event loop.
+        """
+        if not document_names:
+            return self.search_documents(query, session_id, None, top_k, include_content)
+        
+        started = time.perf_counter()
+        sub_queries = [
+            self._search_params(query, session_id, {'document_names': [name]}, top_k, include_content)
+            for name in document_names
+        ]
+        result_lists = asyncio.run(self._search_all(sub_queries))
+        
+        # The same chunk can't come back twice, but keep the merge safe if filters ever overlap
+        merged = {}
+        for results in result_lists:
+            for result in results:
+                if result["id"] not in merged or merged[result["id"]]["score"] < result["score"]:
+                    merged[result["id"]] = result
+        search_results = sorted(merged.values(), key=lambda result: result["score"], reverse=True)
+        search_results = search_results[:top_k or Config.TOP_K_RESULTS]
+        
+        logger.info(
+            f"Fan-out search over {len(sub_queries)} documents returned {len(search_results)} results "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        return search_results
+    
+    async def search_documents_async(self, client, search_params):
+        """
+        Run one search with an async client, using the result cache
+        """
+        cache_key = self._cache_key(search_params)
+        search_results = result_cache.get(cache_key)
+        if search_results is not None:
+            return search_results
+        
+        results = await client.search(**search_params)
+        search_results = [self._to_result(result) async for result in results]
+        result_cache.put(cache_key, search_results)
+        return search_results
+    
+    async def _search_all(self, sub_queries):
+        """
+        Run the sub-queries concurrently over one async client and connection pool
+        """
+        async with AsyncSearchClient(
+            endpoint=self.endpoint,
+            index_name=self.index_name,
+            credential=self.credential
+        ) as client:
+            return await asyncio.gather(
+                *(self.search_documents_async(client, search_params) for search_params in sub_queries)
+            )
+    
+    def _search_params(self, query, session_id=None, document_filters=None, top_k=None, include_content=True):
+        """
+        Search parameters with field projection and filters; no total count
+        """
+        search_params = {
+            "search_text": query,
+            "top": Config.TOP_K_RESULTS if top_k is None else top_k,
+            "select": RESULT_FIELDS if include_content else [field for field in RESULT_FIELDS if field != "content"]
+        }
+        
+        # Add filters
+        filters = []
+        if session_id:
+            filters.append(f"session_id eq '{self._quote(session_id)}'")
+        
+        if document_filters:
+            if 'document_names' in document_filters:
+                doc_filters = " or ".join([
+                    f"document_name eq '{self._quote(name)}'" for name in document_filters['document_names']
+                ])
+                filters.append(f"({doc_filters})")
+        
+        if filters:
+            search_params["filter"] = " and ".join(filters)
+        return search_params
+    
+    def _cache_key(self, search_params):
+        return (self.index_name, json.dumps(search_params, sort_keys=True))
+    
+    def _quote(self, value):
+        """
+        Escape a string literal for an OData filter
+        """
+        return str(value).replace("'", "''")
+    
+    def _to_result(self, result):
+        return {
+            "id": result["id"],
+            "content": result.get("content", ""),
+            "document_name": result["document_name"],
+            "page_number": result.get("page_number", 1),
+            "section": result.get("section", ""),
+            "chunk_index": result["chunk_index"],
+            "score": result.get("@search.score", 0)
+        }
+    
     def delete_document_chunks(self, document_id):
         """
         Delete all chunks for a specific document
@@ -163,7 +311,8 @@ class AzureSearchService:
             # Search for all chunks of the document
             results = self.search_client.search(
                 search_text="*",
-                filter=f"document_id eq '{document_id}'"
+                filter=f"document_id eq '{self._quote(document_id)}'",
+                select=["id"]
             )
             
             # Delete found chunks
@@ -173,6 +322,7 @@ class AzureSearchService:
             
             if documents_to_delete:
                 self.search_client.delete_documents(documents=documents_to_delete)
+                result_cache.clear()
                 logger.info(f"Deleted {len(documents_to_delete)} chunks for document {document_id}")
             
             return len(documents_to_delete)
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import shutil
+import logging
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import Config
+from app import db
+
+logger = logging.getLogger(__name__)
+
+class BulkIngestor:
+    """
+    Ingests a directory tree into a session through the regular processing
+    pipeline, several files at a time. Every finished file is appended to a
+    JSONL checkpoint, so an interrupted run resumes where it stopped without
+    analyzing finished files again.
+    """
+    def __init__(self, app, session_id, checkpoint_path, workers=None, report=None):
+        self.app = app
+        self.session_id = session_id
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers or Config.INGEST_WORKERS
+        self.report = report or logger.info
+        self._checkpoint_lock = threading.Lock()
+    
+    def discover(self, root, extensions):
+        """
+        Files under root with an allowed extension as (path, name relative to root), in a stable order
+        """
+        files = []
+        for directory, subdirectories, filenames in os.walk(root):
+            subdirectories.sort()
+            for filename in sorted(filenames):
+                if '.' in filename and filename.rsplit('.', 1)[1].lower() in extensions:
+                    path = os.path.join(directory, filename)
+                    files.append((path, os.path.relpath(path, root).replace(os.sep, '/')))
+        return files
+    
+    def load_checkpoint(self, retry_failed=False):
+        """
+        Checkpoint entries of files that don't need processing again, by relative name
+        """
+        finished = {}
+        if not os.path.exists(self.checkpoint_path):
+            return finished
+        
+        with open(self.checkpoint_path) as checkpoint:
+            for line in checkpoint:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+                if entry['status'] == 'error' and retry_failed:
+                    finished.pop(entry['path'], None)
+                else:
+                    finished[entry['path']] = entry
+        return finished
+    
+    def run(self, root, extensions, max_size=None, retry_failed=False):
+        """
+        Ingest every pending file under root and return a summary of the run
+        """
+        files = self.discover(root, extensions)
+        finished = self.load_checkpoint(retry_failed)
+        
+        pending = []
+        for path, name in files:
+            entry = finished.get(name)
+            stat = os.stat(path)
+            # Files changed since they were checkpointed are processed again
+            if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+                continue
+            pending.append((path, name, stat))
+        
+        summary = {
+            'files_found': len(files),
+            'already_done': len(files) - len(pending),
+            'indexed': 0,
+            'failed': 0,
+            'skipped': 0,
+            'pages': 0,
+            'bytes': 0
+        }
+        total_bytes = sum(stat.st_size for _, _, stat in pending) or 1
+        self.report(
+            f"{len(files)} files found, {summary['already_done']} already ingested, "
+            f"{len(pending)} to process with {self.workers} workers"
+        )
+        
+        started = time.perf_counter()
+        last_report = started
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = [executor.submit(self._ingest, path, name, stat, max_size) for path, name, stat in pending]
+            for done_count, future in enumerate(as_completed(futures), start=1):
+                entry = future.result()
+                summary[entry['status'] if entry['status'] != 'error' else 'failed'] += 1
+                summary['pages'] += entry.get('pages') or 0
+                summary['bytes'] += entry['size']
+                
+                now = time.perf_counter()
+                if now - last_report >= Config.INGEST_REPORT_INTERVAL or done_count == len(futures):
+                    self.report(self._progress(summary, done_count, len(futures), total_bytes, now - started))
+                    last_report = now
+        except KeyboardInterrupt:
+            self.report("Interrupted; finished files are checkpointed, run the command again to resume")
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown(wait=True)
+        
+        summary['elapsed_s'] = round(time.perf_counter() - started, 1)
+        return summary
+    
+    def _ingest(self, path, name, stat, max_size=None):
+        """
+        Process one file through DocumentProcessor and checkpoint the outcome
+        """
+        from services.document_processor import DocumentProcessor
+        
+        started = time.perf_counter()
+        entry = {'path': name, 'size': stat.st_size, 'mtime': stat.st_mtime}
+        
+        if max_size and stat.st_size > max_size:
+            entry.update(status='skipped', error=f"larger than {max_size} bytes")
+        else:
+            with self.app.app_context():
+                try:
+                    processor = DocumentProcessor()
+                    upload_path = processor.upload_path(name)
+                    shutil.copyfile(path, upload_path)
+                    # Summaries are generated inline: background threads would die with the command
+                    document = processor.process_saved_file(
+                        upload_path, name, mimetypes.guess_type(path)[0] or 'application/octet-stream',
+                        self.session_id, background_summary=False
+                    )
+                    entry.update(status='indexed', document_id=document.id, pages=document.page_count)
+                except Exception as e:
+                    logger.error(f"Could not ingest {name}: {str(e)}")
+                    entry.update(status='error', error=str(e))
+                finally:
+                    db.session.remove()
+        
+        entry['elapsed_s'] = round(time.perf_counter() - started, 2)
+        self._checkpoint(entry)
+        return entry
+    
+    def _checkpoint(self, entry):
+        """
+        Append an entry to the checkpoint and make sure it reached the disk
+        """
+        with self._checkpoint_lock:
+            with open(self.checkpoint_path, 'a') as checkpoint:
+                checkpoint.write(json.dumps(entry) + "\n")
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+    
+    def _progress(self, summary, done_count, total_count, total_bytes, elapsed):
+        """
+        One line of throughput and ETA, extrapolated from the bytes processed so far
+        """
+        elapsed = max(elapsed, 0.001)
+        bytes_rate = summary['bytes'] / elapsed
+        eta = (total_bytes - summary['bytes']) / bytes_rate if bytes_rate else 0
+        minutes, seconds = divmod(int(eta), 60)
+        return (
+            f"{done_count}/{total_count} files ({summary['failed']} failed, {summary['skipped']} skipped) | "
+            f"{done_count / elapsed:.2f} files/s, {summary['pages'] / elapsed:.1f} pages/s, "
+            f"{bytes_rate / 1048576:.2f} MB/s | ETA {minutes}m{seconds:02d}s"
+        )
@@ -0,0 +1,62 @@
+import time
+import threading
+from collections import deque
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request runs out of its time budget
+    """
+    pass
+
+class Deadline:
+    """
+    Time budget of one request, set at the route and passed down to every stage
+    so each stage only waits as long as the request still has left
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+    
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def expired(self):
+        return self.remaining() <= 0
+    
+    def check(self, stage):
+        """
+        Raise if the budget is used up before starting the given stage
+        """
+        if self.expired():
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:g}s exceeded before {stage}")
+    
+    def timeout(self, cap):
+        """
+        Timeout for one upstream call: the remaining budget, but never more than cap
+        """
+        return min(cap, self.remaining())
+
+class LatencyTracker:
+    """
+    Recent latencies of an upstream call, used to pick the hedging delay
+    """
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+    
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+    
+    def percentile(self, fraction):
+        """
+        Latency at the given fraction (e.g. 0.95), or None without samples
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+    
+    def __len__(self):
+        return len(self._samples)
@@ -0,0 +1,122 @@
+import base64
+import hashlib
+import logging
+import random
+from array import array
+from config import Config
+from services.text_utils import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Parameters of the MinHash permutations, fixed so stored signatures stay comparable
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+class NearDuplicateDetector:
+    """
+    MinHash signatures over word shingles, with LSH banding to find
+    near-duplicate passages without comparing every pair.
+    """
+    def __init__(self, num_perm=64, bands=16, shingle_size=5, threshold=None):
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold or Config.DEDUP_THRESHOLD
+        
+        generator = random.Random(1)
+        self.permutations = [
+            (generator.randint(1, MERSENNE_PRIME - 1), generator.randint(0, MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+    
+    def signature(self, text):
+        """
+        MinHash signature of a text's word shingles
+        """
+        tokens = tokenize(text, remove_stopwords=False)
+        if len(tokens) <= self.shingle_size:
+            shingles = {" ".join(tokens)}
+        else:
+            shingles = {
+                " ".join(tokens[i:i + self.shingle_size])
+                for i in range(len(tokens) - self.shingle_size + 1)
+            }
+        
+        hashes = [
+            int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+            for shingle in shingles
+        ]
+        
+        return tuple(
+            min((a * h + b) % MERSENNE_PRIME for h in hashes) & MAX_HASH
+            for a, b in self.permutations
+        )
+    
+    def encode_signatures(self, signatures):
+        """
+        Pack a list of signatures into a compact string for storage
+        """
+        packed = array('I')
+        for signature in signatures:
+            packed.extend(signature)
+        return base64.b64encode(packed.tobytes()).decode('ascii')
+    
+    def decode_signatures(self, data):
+        """
+        Unpack signatures stored with encode_signatures
+        """
+        packed = array('I')
+        packed.frombytes(base64.b64decode(data))
+        return [
+            tuple(packed[i:i + self.num_perm])
+            for i in range(0, len(packed), self.num_perm)
+        ]
+    
+    def similarity(self, first, second):
+        """
+        Estimated Jaccard similarity of two signatures
+        """
+        return sum(1 for x, y in zip(first, second) if x == y) / self.num_perm
+    
+    def deduplicate(self, passages):
+        """
+        Drop passages that nearly duplicate an earlier one.
+        Each passage needs a 'signature'; the kept passage collects the
+        citations of its duplicates under 'duplicates'.
+        Returns the kept passages and the number of characters removed.
+        """
+        buckets = {}
+        kept = []
+        chars_removed = 0
+        
+        for passage in passages:
+            signature = passage['signature']
+            band_keys = [
+                (band, signature[band * self.rows:(band + 1) * self.rows])
+                for band in range(self.bands)
+            ]
+            
+            # Candidates share at least one band; confirm with the full signature
+            original = None
+            for key in band_keys:
+                for candidate in buckets.get(key, []):
+                    if self.similarity(signature, candidate['signature']) >= self.threshold:
+                        original = candidate
+                        break
+                if original is not None:
+                    break
+            
+            if original is not None:
+                original.setdefault('duplicates', []).append({
+                    'document_name': passage['document_name'],
+                    'page_number': passage.get('page_number')
+                })
+                chars_removed += len(passage['content'])
+                continue
+            
+            for key in band_keys:
+                buckets.setdefault(key, []).append(passage)
+            kept.append(passage)
+        
+        return kept, chars_removed
@@ -1,12 +1,33 @@
 import os
 import logging
+import threading
 from azure.ai.formrecognizer import DocumentAnalysisClient
 from azure.core.credentials import AzureKeyCredential
 from azure.core.exceptions import HttpResponseError
 from config import Config
+from services.deadline import DeadlineExceeded
+from services.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+# Azure SDK clients are thread-safe, so one client per endpoint is shared by all requests
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_shared_client(endpoint, key):
+    """
+    Return the process-wide DocumentAnalysisClient for an endpoint
+    """
+    with _clients_lock:
+        client = _clients.get((endpoint, key))
+        if client is None:
+            client = DocumentAnalysisClient(
+                endpoint=endpoint,
+                credential=AzureKeyCredential(key)
+            )
+            _clients[(endpoint, key)] = client
+        return client
+
 class DocumentIntelligenceService:
     def __init__(self):
         self.endpoint = Config.AZURE_DI_ENDPOINT
@@ -15,73 +36,100 @@ class DocumentIntelligenceService:
         if not self.endpoint or not self.key:
             raise ValueError("Azure Document Intelligence credentials not configured")
         
-        self.client = DocumentAnalysisClient(
-            endpoint=self.endpoint,
-            credential=AzureKeyCredential(self.key)
-        )
+        self.client = get_shared_client(self.endpoint, self.key)
     
-    def analyze_document(self, file_path):
+    def analyze_document(self, file_path, deadline=None, page_numbers=None):
         """
         Analyze document using Azure Document Intelligence
         Returns extracted text content
+        page_numbers maps the analyzed pages back to the original page numbers
+        when pages were dropped before upload
         """
         try:
             logger.info(f"Analyzing document: {file_path}")
             
-            with open(file_path, 'rb') as file:
-                # Use prebuilt-document model for general document analysis
-                poller = self.client.begin_analyze_document(
-                    "prebuilt-document", 
-                    document=file
-                )
-                result = poller.result()
+            with tracer.span('document_intelligence.analyze', model='prebuilt-document',
+                             bytes=os.path.getsize(file_path)) as span:
+                with open(file_path, 'rb') as file:
+                    # Use prebuilt-document model for general document analysis
+                    poller = self.client.begin_analyze_document(
+                        "prebuilt-document", 
+                        document=file
+                    )
+                    result = self._wait_for_result(poller, deadline)
+                span.set_attribute('pages', len(result.pages))
             
             # Extract all text content
             full_text = ""
+            pages = []
             
             # Extract text from pages
             for page_idx, page in enumerate(result.pages):
-                page_text = f"\n--- Page {page_idx + 1} ---\n"
+                page_number = page_numbers[page_idx] if page_numbers else page_idx + 1
+                page_text = ""
                 
                 # Extract lines from page
                 if hasattr(page, 'lines') and page.lines:
                     for line in page.lines:
                         page_text += line.content + "\n"
                 
-                full_text += page_text
+                full_text += f"\n--- Page {page_number} ---\n" + page_text
+                pages.append({'page_number': page_number, 'text': page_text})
             
-            # Extract tables as text
+            # Extract tables as text, and in columnar form for direct lookups
+            tables = []
             if hasattr(result, 'tables') and result.tables:
                 for table_idx, table in enumerate(result.tables):
                     full_text += f"\n--- Table {table_idx + 1} ---\n"
                     
                     # Convert table to text format
                     table_rows = {}
+                    header_rows = set()
                     for cell in table.cells:
                         row_idx = cell.row_index
                         if row_idx not in table_rows:
                             table_rows[row_idx] = {}
                         table_rows[row_idx][cell.column_index] = cell.content
+                        if getattr(cell, 'kind', None) == 'columnHeader':
+                            header_rows.add(row_idx)
                     
                     # Format table as text
+                    table_text = ""
                     for row_idx in sorted(table_rows.keys()):
                         row = table_rows[row_idx]
                         row_text = " | ".join([row.get(col_idx, "") for col_idx in sorted(row.keys())])
-                        full_text += row_text + "\n"
+                        table_text += row_text + "\n"
+                    full_text += table_text
+                    
+                    columnar = self._to_columnar(table, table_rows, header_rows, page_numbers)
+                    columnar['text'] = table_text
+                    tables.append(columnar)
             
-            # Extract key-value pairs as text
+            # Extract key-value pairs as text, and as pairs for direct lookups
+            key_value_pairs = []
             if hasattr(result, 'key_value_pairs') and result.key_value_pairs:
                 full_text += "\n--- Key-Value Pairs ---\n"
                 for kv_pair in result.key_value_pairs:
                     if kv_pair.key and kv_pair.value:
                         full_text += f"{kv_pair.key.content}: {kv_pair.value.content}\n"
+                        key_value_pairs.append({
+                            'key': kv_pair.key.content,
+                            'value': kv_pair.value.content,
+                            'page_number': self._first_page(kv_pair.key, page_numbers),
+                            'confidence': getattr(kv_pair, 'confidence', None)
+                        })
             
             logger.info("Document analysis completed successfully")
             return {
                 'content': full_text.strip(),
-                'page_count': len(result.pages)
+                'page_count': len(result.pages),
+                'pages': pages,
+                'tables': tables,
+                'key_value_pairs': key_value_pairs
             }
             
+        except DeadlineExceeded:
+            raise
         except HttpResponseError as e:
             logger.error(f"Azure Document Intelligence API error: {str(e)}")
             raise Exception(f"Document analysis failed: {str(e)}")
@@ -89,34 +137,98 @@ class DocumentIntelligenceService:
             logger.error(f"Error analyzing document {file_path}: {str(e)}")
             raise Exception(f"Document analysis failed: {str(e)}")
     
-    def extract_text_from_image(self, file_path):
+    def _wait_for_result(self, poller, deadline=None):
+        """
+        Wait for an analysis to finish, but no longer than the request deadline
+        """
+        with tracer.span('document_intelligence.poll'):
+            if deadline is None:
+                return poller.result()
+            
+            result = poller.result(timeout=deadline.remaining())
+            if not poller.done():
+                logger.error("Document analysis ran past the request deadline")
+                raise DeadlineExceeded("Document analysis took too long. Please try again.")
+            return result
+    
+    def _to_columnar(self, table, table_rows, header_rows, page_numbers=None):
+        """
+        Convert a table's cells to headers plus one list of values per column
+        """
+        column_count = getattr(table, 'column_count', None) or (
+            max((max(row.keys()) for row in table_rows.values() if row), default=-1) + 1
+        )
+        
+        # Use the first row as headers when Azure didn't mark any
+        if not header_rows and table_rows:
+            header_rows = {min(table_rows.keys())}
+        
+        headers = []
+        for col_idx in range(column_count):
+            parts = [table_rows[row_idx].get(col_idx, "") for row_idx in sorted(header_rows)]
+            headers.append(" ".join(part for part in parts if part))
+        
+        body_rows = [row_idx for row_idx in sorted(table_rows.keys()) if row_idx not in header_rows]
+        columns = [
+            [table_rows[row_idx].get(col_idx, "") for row_idx in body_rows]
+            for col_idx in range(column_count)
+        ]
+        
+        return {
+            'page_number': self._first_page(table, page_numbers),
+            'headers': headers,
+            'columns': columns,
+            'row_count': len(body_rows)
+        }
+    
+    def _first_page(self, element, page_numbers=None):
+        """
+        Page number of the first bounding region of an analyzed element
+        """
+        regions = getattr(element, 'bounding_regions', None)
+        if not regions:
+            return None
+        page_number = regions[0].page_number
+        if page_numbers and 0 < page_number <= len(page_numbers):
+            return page_numbers[page_number - 1]
+        return page_number
+    
+    def extract_text_from_image(self, file_path, deadline=None):
         """
         Extract text from image files using OCR
         """
         try:
             logger.info(f"Extracting text from image: {file_path}")
             
-            with open(file_path, 'rb') as file:
-                poller = self.client.begin_analyze_document(
-                    "prebuilt-read",
-                    document=file
-                )
-                result = poller.result()
+            with tracer.span('document_intelligence.analyze', model='prebuilt-read',
+                             bytes=os.path.getsize(file_path)) as span:
+                with open(file_path, 'rb') as file:
+                    poller = self.client.begin_analyze_document(
+                        "prebuilt-read",
+                        document=file
+                    )
+                    result = self._wait_for_result(poller, deadline)
+                span.set_attribute('pages', len(result.pages))
             
             extracted_text = ""
+            pages = []
             for page_idx, page in enumerate(result.pages):
-                page_text = f"\n--- Page {page_idx + 1} ---\n"
+                page_text = ""
                 if hasattr(page, 'lines') and page.lines:
                     for line in page.lines:
                         page_text += line.content + "\n"
-                extracted_text += page_text
+                extracted_text += f"\n--- Page {page_idx + 1} ---\n" + page_text
+                pages.append({'page_number': page_idx + 1, 'text': page_text})
             
             logger.info("OCR extraction completed successfully")
             return {
                 'content': extracted_text.strip(),
-                'page_count': len(result.pages)
+                'page_count': len(result.pages),
+                'pages': pages
             }
             
+        except DeadlineExceeded:
+            raise
         except HttpResponseError as e:
             logger.error(f"Azure Document Intelligence OCR API error: {str(e)}")
             raise Exception(f"OCR extraction failed: {str(e)}")
@@ -1,11 +1,27 @@
 import os
 import uuid
 import logging
+import time
+import threading
 from datetime import datetime
+from flask import current_app, has_request_context
+from sqlalchemy.orm import undefer
 from werkzeug.utils import secure_filename
+from config import Config
+from services.admission import AdmissionRejected
 from services.document_intelligence import DocumentIntelligenceService
-from services.groq_llm import GroqLLMService
-from models import Document
+from services.document_router import DocumentRouter
+from services.groq_llm import GroqLLMService, TransientLLMError
+from services.payload_optimizer import PayloadOptimizer
+from services.reranker import Reranker
+from services.structured_lookup import StructuredLookupService
+from services.dedup import NearDuplicateDetector
+from services.extractive import ExtractiveAnswerer
+from services.progress import progress_broker
+from services.tracing import tracer
+from services.text_utils import estimate_tokens, split_into_passages
+from services.versioning import DocumentVersioning
+from models import Document, ExtractedTable, KeyValuePair
 from app import db
 
 logger = logging.getLogger(__name__)
@@ -14,82 +30,306 @@ class DocumentProcessor:
     def __init__(self):
         self.doc_intelligence = DocumentIntelligenceService()
         self.llm_service = GroqLLMService()
+        self.router = DocumentRouter()
+        self.dedup = NearDuplicateDetector()
+        self.reranker = Reranker()
+        self.structured_lookup = StructuredLookupService()
+        self.payload_optimizer = PayloadOptimizer()
+        self.extractive = ExtractiveAnswerer()
+        self.versioning = DocumentVersioning()
     
-    def process_uploaded_file(self, file, session_id):
+    def process_uploaded_file(self, file, session_id, deadline=None):
         """
         Process an uploaded file through the complete pipeline
         """
+        # Save file temporarily
+        file_path = self.upload_path(file.filename)
+        file.save(file_path)
+        
+        return self.process_saved_file(
+            file_path, file.filename, file.content_type or 'application/octet-stream', session_id, deadline
+        )
+    
+    def upload_path(self, original_filename):
+        """
+        Unique path in the upload folder for a file being processed
+        """
+        return os.path.join('uploads', f"{uuid.uuid4()}_{secure_filename(original_filename)}")
+    
+    def process_saved_file(self, file_path, original_filename, mime_type, session_id, deadline=None,
+                           background_summary=True):
+        """
+        Process a file already saved to the upload folder. The file is removed afterwards.
+        With background_summary off the summary is generated before returning.
+        """
         document = None
-        file_path = None
+        current = None
+        temporary_paths = [file_path]
         try:
-            # Save file temporarily
-            filename = secure_filename(file.filename)
-            file_path = os.path.join('uploads', f"{uuid.uuid4()}_{filename}")
-            file.save(file_path)
+            filename = secure_filename(original_filename)
+            file_hash = self.versioning.file_hash(file_path)
+            page_hashes = self.versioning.page_hashes(file_path, filename)
+            
+            # A re-upload of a document in this session becomes its new version
+            current = self.versioning.find_current(session_id, original_filename)
+            if current is not None:
+                return self._process_revision(
+                    current, file_path, filename, file_hash, page_hashes, temporary_paths, deadline,
+                    background_summary
+                )
             
             # Create document record
             document = Document()
             document.filename = filename
-            document.original_filename = file.filename
+            document.original_filename = original_filename
             document.file_path = file_path
             document.file_size = os.path.getsize(file_path)
-            document.mime_type = file.content_type or 'application/octet-stream'
+            document.mime_type = mime_type
             document.session_id = session_id
             document.status = 'processing'
             db.session.add(document)
             db.session.commit()
+            progress_broker.publish(session_id, document.id, 'processing', 'received', "Upload received")
             
-            logger.info(f"Processing document: {file.filename}")
-            
-            # Extract content based on file type
-            if self._is_image_file(filename):
-                extracted_data = self.doc_intelligence.extract_text_from_image(file_path)
-            else:
-                extracted_data = self.doc_intelligence.analyze_document(file_path)
+            logger.info(f"Processing document: {original_filename}")
             
-            # Store extracted content in session for immediate use
-            from flask import session
-            if 'documents_content' not in session:
-                session['documents_content'] = {}
+            # Shrink the payload sent to Azure where possible
+            payload = self.payload_optimizer.optimize(file_path, filename)
+            temporary_paths.append(payload['path'])
+            document.transfer_bytes = payload['optimized_bytes']
             
-            session['documents_content'][str(document.id)] = {
-                'content': extracted_data['content'],
-                'filename': document.original_filename,
-                'page_count': extracted_data.get('page_count', 1)
-            }
+            # Extract content based on file type
+            progress_broker.publish(session_id, document.id, 'processing', 'extracting', "Extracting content")
+            extracted_data = self._extract(payload['path'], filename, deadline, payload['page_numbers'])
+            pages_done = len(extracted_data.get('pages', [])) or extracted_data.get('page_count', 1)
+            progress_broker.publish(
+                session_id, document.id, 'processing', 'extracted', f"{pages_done} pages extracted, indexing",
+                pages_done=pages_done
+            )
             
-            # Update document status only
+            # Store extracted content with the document record, keeping the pages for later revisions
+            self._store_extraction(document, extracted_data)
+            self.versioning.record_version(
+                document, file_hash, document.file_size, self.versioning.split_pages(extracted_data),
+                page_hashes, pages_analyzed=len(extracted_data.get('pages', [])), pages_reused=0
+            )
             document.status = 'indexed'
             document.processed_date = datetime.utcnow()
             db.session.commit()
+            progress_broker.publish(session_id, document.id, 'indexed', 'indexed', "Document processed")
             
-            # Clean up temporary file
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                logger.warning(f"Could not remove temporary file {file_path}: {e}")
+            # Clean up temporary files
+            self._remove_files(temporary_paths)
             
-            logger.info(f"Successfully processed document: {file.filename}")
+            # Summarize in the background so the upload isn't held up by the LLM
+            self._summarize(document.id, background_summary)
+            
+            logger.info(f"Successfully processed document: {original_filename}")
             return document
             
         except Exception as e:
-            logger.error(f"Error processing document {file.filename}: {str(e)}")
+            logger.error(f"Error processing document {original_filename}: {str(e)}")
+            db.session.rollback()
             
             # Update document status to error
             if document is not None:
                 document.status = 'error'
                 document.error_message = str(e)
                 db.session.commit()
+                progress_broker.publish(session_id, document.id, 'error', 'error', str(e))
+            elif current is not None:
+                # A failed revision leaves the current version in place
+                progress_broker.publish(
+                    session_id, current.id, 'indexed', 'error', f"New version failed: {str(e)}"
+                )
             
-            # Clean up temporary file
-            if file_path is not None and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except Exception:
-                    pass
+            # Clean up temporary files
+            self._remove_files(temporary_paths)
             
             raise
     
+    def _process_revision(self, document, file_path, filename, file_hash, page_hashes, temporary_paths, deadline,
+                          background_summary=True):
+        """
+        Make a new upload the current version of an existing document.
+        Only pages that differ from the current version are analyzed. The
+        document keeps serving its old content until the new version is
+        committed in a single transaction.
+        """
+        reused, changed = self.versioning.plan(document, file_hash, page_hashes)
+        logger.info(
+            f"Processing new version of {document.original_filename}: "
+            f"{'all' if changed is None else len(changed)} pages to analyze, {len(reused)} reused"
+        )
+        
+        # The document stays ready with its current version while the new one is processed
+        progress_broker.publish(
+            document.session_id, document.id, 'indexed', 'revising',
+            f"New version received, analyzing {'all' if changed is None else len(changed)} pages"
+        )
+        
+        pages = dict(reused)
+        pages_analyzed = 0
+        transfer_bytes = 0
+        if changed is None or changed:
+            # Send only the changed pages when some can be reused
+            source_path = file_path
+            base_numbers = None
+            if changed and len(changed) < len(page_hashes):
+                source_path = self.versioning.subset_pdf(file_path, changed)
+                temporary_paths.append(source_path)
+                base_numbers = changed
+            
+            payload = self.payload_optimizer.optimize(source_path, filename)
+            temporary_paths.append(payload['path'])
+            transfer_bytes = payload['optimized_bytes']
+            
+            page_numbers = payload['page_numbers']
+            if base_numbers:
+                page_numbers = [base_numbers[index - 1] for index in page_numbers] if page_numbers else base_numbers
+            
+            analyzed = self.versioning.split_pages(self._extract(payload['path'], filename, deadline, page_numbers))
+            pages.update(analyzed)
+            pages_analyzed = len(analyzed)
+            progress_broker.publish(
+                document.session_id, document.id, 'indexed', 'extracted',
+                f"{pages_analyzed} pages extracted, indexing", pages_done=pages_analyzed
+            )
+        
+        extracted_data = self.versioning.assemble(pages, len(page_hashes) if page_hashes else None)
+        
+        # Swap in the new version: everything below becomes visible with one commit
+        ExtractedTable.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+        KeyValuePair.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+        self._store_extraction(document, extracted_data)
+        self.versioning.record_version(
+            document, file_hash, os.path.getsize(file_path), self.versioning.split_pages(extracted_data),
+            page_hashes, pages_analyzed, len(reused)
+        )
+        document.filename = filename
+        document.file_path = file_path
+        document.file_size = os.path.getsize(file_path)
+        document.transfer_bytes = transfer_bytes
+        document.processed_date = datetime.utcnow()
+        if pages_analyzed:
+            document.summary = None
+        db.session.commit()
+        progress_broker.publish(
+            document.session_id, document.id, 'indexed', 'indexed',
+            f"New version stored ({pages_analyzed} pages analyzed, {len(reused)} reused)"
+        )
+        
+        self._remove_files(temporary_paths)
+        if pages_analyzed:
+            self._summarize(document.id, background_summary)
+        
+        logger.info(
+            f"Stored new version of {document.original_filename} "
+            f"({pages_analyzed} pages analyzed, {len(reused)} reused)"
+        )
+        return document
+    
+    def _extract(self, file_path, filename, deadline=None, page_numbers=None):
+        """
+        Extract content based on file type
+        """
+        if self._is_image_file(filename):
+            return self.doc_intelligence.extract_text_from_image(file_path, deadline)
+        return self.doc_intelligence.analyze_document(file_path, deadline, page_numbers)
+    
+    def _store_extraction(self, document, extracted_data):
+        """
+        Store extracted content and its derived data with the document record
+        """
+        document.content = extracted_data['content']
+        document.page_count = extracted_data.get('page_count', 1)
+        document.block_signatures = self._compute_block_signatures(extracted_data['content'])
+        self.structured_lookup.store(document, extracted_data)
+    
+    def _remove_files(self, paths):
+        """
+        Remove temporary files that still exist
+        """
+        for path in set(paths):
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove temporary file {path}: {e}")
+    
+    def _summarize(self, document_id, background=True):
+        """
+        Generate the document summary used for routing, on a background thread or inline
+        """
+        if background:
+            self._start_summary_generation(document_id)
+        else:
+            # One attempt: the caller is waiting, and documents without a summary are still searched
+            self._generate_summary(current_app._get_current_object(), document_id, attempts=1)
+    
+    def _start_summary_generation(self, document_id):
+        """
+        Generate the document summary used for routing on a background thread
+        """
+        app = current_app._get_current_object()
+        thread = threading.Thread(
+            target=self._generate_summary,
+            args=(app, document_id),
+            daemon=True
+        )
+        thread.start()
+    
+    def _generate_summary(self, app, document_id, attempts=None):
+        """
+        Summarize a processed document and store the summary on its record.
+        Summaries share the LLM capacity with interactive questions, so they
+        wait longer for it. When there is no capacity or GROQ fails transiently
+        they are retried with backoff instead of being dropped; other failures
+        are not retried.
+        """
+        attempts = attempts or Config.SUMMARY_MAX_ATTEMPTS
+        with app.app_context():
+            for attempt in range(1, attempts + 1):
+                try:
+                    document = db.session.get(Document, document_id)
+                    if document is None or not document.content or document.summary:
+                        return
+                    content, name = document.content, document.original_filename
+                    # Don't hold a database connection while waiting on the LLM
+                    db.session.commit()
+                    
+                    summary = self.llm_service.generate_summary(
+                        content, name, queue_timeout=Config.SUMMARY_QUEUE_TIMEOUT
+                    )
+                    if summary:
+                        document = db.session.get(Document, document_id)
+                        if document is not None:
+                            document.summary = summary
+                            db.session.commit()
+                            logger.info(f"Stored summary for document {document_id}")
+                    return
+                
+                except (AdmissionRejected, TransientLLMError) as e:
+                    logger.warning(f"Could not summarize document {document_id}: {str(e)}")
+                    db.session.rollback()
+                except Exception as e:
+                    logger.error(f"Could not summarize document {document_id}: {str(e)}")
+                    db.session.rollback()
+                    return
+                
+                if attempt < attempts:
+                    time.sleep(Config.SUMMARY_RETRY_SECONDS * 2 ** (attempt - 1))
+            
+            logger.error(f"Giving up on the summary of document {document_id} after {attempts} attempts")
+    
+    def _compute_block_signatures(self, content):
+        """
+        MinHash signatures of the document's passages, used for deduplication
+        """
+        passages = split_into_passages(content, Config.PASSAGE_MAX_CHARS)
+        return self.dedup.encode_signatures(
+            [self.dedup.signature(passage['content']) for passage in passages]
+        )
     
     def _is_image_file(self, filename):
         """
@@ -98,28 +338,28 @@ class DocumentProcessor:
         image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff'}
         return any(filename.lower().endswith(ext) for ext in image_extensions)
     
-    def search_and_answer(self, query, session_id, document_filters=None):
+    def search_and_answer(self, query, session_id, document_filters=None, deadline=None, fast_path=True):
         """
-        Answer question using full document content with LLM
+        Answer question using full document content with LLM.
+        With fast_path, exact lookups may be answered from the stored
+        extraction results without an LLM call.
         """
         try:
             from flask import session
             
-            # Get document content from session
-            documents_content = session.get('documents_content', {})
+            started = time.perf_counter()
+            timings = {'db_ms': 0.0}
             
-            if not documents_content:
-                return {
-                    "response": "I couldn't find any documents to answer this question. Please upload and process some documents first.",
-                    "sources": [],
-                    "context_used": 0
-                }
+            # Documents processed before content was stored in the database
+            documents_content = session.get('documents_content', {})
             
             # Get indexed documents from database to check which ones are ready
+            db_start = time.perf_counter()
             indexed_docs = Document.query.filter_by(
                 session_id=session_id, 
                 status='indexed'
             ).all()
+            timings['db_ms'] += (time.perf_counter() - db_start) * 1000
             
             if not indexed_docs:
                 return {
@@ -128,42 +368,316 @@ class DocumentProcessor:
                     "context_used": 0
                 }
             
-            # Combine all document content from session
-            full_context = ""
-            sources = []
-            
-            for doc in indexed_docs:
-                doc_content = documents_content.get(str(doc.id))
-                if doc_content:
-                    # Apply document filters if specified
-                    if document_filters and 'document_names' in document_filters:
-                        if doc.original_filename not in document_filters['document_names']:
-                            continue
-                    
-                    full_context += f"\n--- Document: {doc.original_filename} ---\n"
-                    full_context += doc_content['content'] + "\n"
-                    
-                    sources.append({
-                        'document_name': doc.original_filename,
-                        'page_count': doc_content.get('page_count', 1)
-                    })
+            # Apply document filters if specified
+            if document_filters and 'document_names' in document_filters:
+                indexed_docs = [
+                    doc for doc in indexed_docs
+                    if doc.original_filename in document_filters['document_names']
+                ]
             
-            if not full_context.strip():
+            # Answer exact key and table lookups straight from the structured store
+            if fast_path and Config.STRUCTURED_LOOKUP_ENABLED:
+                db_start = time.perf_counter()
+                with tracer.span('lookup.structured') as span:
+                    structured_answer = self.structured_lookup.lookup(query, indexed_docs)
+                    span.set_attribute('hit', structured_answer is not None)
+                timings['db_ms'] += (time.perf_counter() - db_start) * 1000
+                if structured_answer:
+                    return self._with_accounting(structured_answer, timings, started, context_bytes=0)
+            
+            # Route the question to the most relevant documents using their summaries
+            if Config.ROUTING_ENABLED:
+                indexed_docs = self.router.select_documents(query, indexed_docs)
+            
+            # Load the content of the selected documents in one query
+            db_start = time.perf_counter()
+            with tracer.span('content.load', documents=len(indexed_docs)) as span:
+                self._load_content(indexed_docs)
+                span.set_attribute('bytes', sum(len(doc.content or "") for doc in indexed_docs))
+            timings['db_ms'] += (time.perf_counter() - db_start) * 1000
+            
+            # Collect passages of the selected documents only, sending repeated passages once
+            with tracer.span('context.passages') as span:
+                passages, sources, dedup_report = self._collect_passages(indexed_docs, documents_content)
+                span.set_attribute('passages', len(passages))
+                span.set_attribute('chars_deduplicated', dedup_report['chars_saved'])
+            
+            if not passages:
                 return {
                     "response": "No content found in the processed documents.",
                     "sources": sources,
                     "context_used": 0
                 }
             
-            # Generate response using LLM with full context
-            llm_response = self.llm_service.generate_response_from_context(query, full_context, sources)
+            # Return the database connection to the pool before waiting on the LLM
+            db.session.commit()
             
-            return llm_response
+            return self._answer_from_passages(
+                query, passages, sources, dedup_report, timings, started, deadline, fast_path
+            )
             
         except Exception as e:
             logger.error(f"Error in search and answer: {str(e)}")
             raise
     
+    def _answer_from_passages(self, query, passages, sources, dedup_report, timings, started,
+                              deadline=None, fast_path=True):
+        """
+        Answer from collected passages: extractively, over the re-ranked best
+        passages, or over all of them (map-reduce when they don't fit)
+        """
+        candidates = []
+        if Config.RERANK_ENABLED or (fast_path and Config.EXTRACTIVE_ENABLED):
+            candidates = self.reranker.retrieve(query, passages)
+        
+        # Answer single-sentence lookups with the sentence itself
+        if fast_path and Config.EXTRACTIVE_ENABLED:
+            with tracer.span('lookup.extractive', candidates=len(candidates)) as span:
+                extractive_answer = self.extractive.answer(query, candidates)
+                span.set_attribute('hit', extractive_answer is not None)
+            if extractive_answer:
+                timings['retrieval_ms'] = (time.perf_counter() - started) * 1000
+                return self._with_accounting(extractive_answer, timings, started, context_bytes=0)
+        
+        # Send only the best passages when the question has terms to rank by
+        if Config.RERANK_ENABLED:
+            with tracer.span('rerank', candidates=len(candidates)) as span:
+                ranked, rerank_ms = self.reranker.rerank(query, candidates)
+                selected = self._fit_to_budget(ranked)
+                span.set_attribute('selected', len(selected))
+            if selected:
+                with tracer.span('context.assemble', passages=len(selected)) as span:
+                    context = self.llm_service._build_context(selected)
+                    span.set_attribute('bytes', len(context))
+                timings['retrieval_ms'] = (time.perf_counter() - started) * 1000
+                llm_response = self.llm_service.generate_response_from_context(
+                    query, context, self.llm_service._extract_sources(selected), deadline
+                )
+                llm_response['dedup'] = dedup_report
+                llm_response['rerank'] = {
+                    'candidates': len(candidates),
+                    'selected': len(selected),
+                    'dropped_for_budget': len(ranked) - len(selected),
+                    'latency_ms': round(rerank_ms, 1)
+                }
+                return self._with_accounting(llm_response, timings, started, len(context))
+        
+        with tracer.span('context.assemble', passages=len(passages)) as span:
+            context_parts = self._format_context_parts(passages)
+            full_context = "".join(context_parts)
+            span.set_attribute('bytes', len(full_context))
+        timings['retrieval_ms'] = (time.perf_counter() - started) * 1000
+        
+        # Fall back to map-reduce when the context doesn't fit into one prompt
+        if estimate_tokens(full_context) > Config.LLM_CONTEXT_TOKEN_BUDGET:
+            llm_response = self.llm_service.generate_map_reduce_response(query, context_parts, sources, deadline)
+        else:
+            # Generate response using LLM with full context
+            llm_response = self.llm_service.generate_response_from_context(query, full_context, sources, deadline)
+        
+        llm_response['dedup'] = dedup_report
+        return self._with_accounting(llm_response, timings, started, len(full_context))
+    
+    def prepare_batch(self, questions, session_id, document_filters=None):
+        """
+        Load and split the session's documents once for a batch of questions,
+        and answer the exact lookups among them from the structured store.
+        Returns None when no document is ready. The documents are detached
+        from the database session so worker threads can read them.
+        """
+        started = time.perf_counter()
+        documents_content = {}
+        if has_request_context():
+            from flask import session
+            documents_content = session.get('documents_content', {})
+        
+        documents = Document.query.filter_by(session_id=session_id, status='indexed').all()
+        if document_filters and 'document_names' in document_filters:
+            documents = [doc for doc in documents if doc.original_filename in document_filters['document_names']]
+        if not documents:
+            return None
+        
+        answers = {}
+        if Config.STRUCTURED_LOOKUP_ENABLED:
+            for index, question in enumerate(questions):
+                lookup_started = time.perf_counter()
+                structured_answer = self.structured_lookup.lookup(question, documents)
+                if structured_answer:
+                    timings = {'db_ms': (time.perf_counter() - lookup_started) * 1000}
+                    answers[index] = self._with_accounting(structured_answer, timings, lookup_started, 0)
+        
+        with tracer.span('content.load', documents=len(documents)) as span:
+            self._load_content(documents)
+            span.set_attribute('bytes', sum(len(doc.content or "") for doc in documents))
+        with tracer.span('context.passages') as span:
+            passages, sources, dedup_report = self._collect_passages(documents, documents_content)
+            span.set_attribute('passages', len(passages))
+        
+        # Keep the loaded documents readable after the connection is returned to the pool
+        for doc in documents:
+            db.session.expunge(doc)
+        db.session.commit()
+        
+        return {
+            'documents': documents,
+            'passages': passages,
+            'sources': sources,
+            'dedup': dedup_report,
+            'answers': answers,
+            'prepare_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+    
+    def answer_prepared(self, query, prepared, deadline=None):
+        """
+        Answer one question of a batch from prepared passages, without database access
+        """
+        started = time.perf_counter()
+        timings = {'db_ms': 0.0}
+        sources = prepared['sources']
+        
+        # Ranking sets scores on the passages, so every question works on its own copies
+        passages = [dict(passage) for passage in prepared['passages']]
+        
+        # Route among the prepared documents; a kept passage also counts for the documents it duplicates
+        if Config.ROUTING_ENABLED:
+            names = {doc.original_filename for doc in self.router.select_documents(query, prepared['documents'])}
+            passages = [
+                passage for passage in passages
+                if passage['document_name'] in names
+                or any(duplicate['document_name'] in names for duplicate in passage.get('duplicates', []))
+            ]
+            sources = [source for source in sources if source['document_name'] in names]
+        
+        if not passages:
+            return {
+                "response": "No content found in the processed documents.",
+                "sources": sources,
+                "context_used": 0
+            }
+        
+        return self._answer_from_passages(
+            query, passages, sources, prepared['dedup'], timings, started, deadline
+        )
+    
+    def _fit_to_budget(self, passages):
+        """
+        The best-ranked passages whose context fits the LLM token budget
+        """
+        fitted = []
+        used_tokens = 0
+        for passage in passages:
+            tokens = estimate_tokens(self.llm_service._build_context([passage]))
+            if fitted and used_tokens + tokens > Config.LLM_CONTEXT_TOKEN_BUDGET:
+                break
+            fitted.append(passage)
+            used_tokens += tokens
+        return fitted
+    
+    def _load_content(self, documents):
+        """
+        Load the deferred content columns of the given documents with a single query
+        """
+        ids = [doc.id for doc in documents]
+        if ids:
+            Document.query.options(
+                undefer(Document.content),
+                undefer(Document.block_signatures)
+            ).filter(Document.id.in_(ids)).all()
+    
+    def _with_accounting(self, response, timings, started, context_bytes):
+        """
+        Attach stage timings and context size to a response
+        """
+        usage = response.get('usage', {})
+        response['context_bytes'] = context_bytes
+        response['timings'] = {
+            **response.get('timings', {}),
+            'db_ms': round(timings['db_ms'], 1),
+            'retrieval_ms': round(timings.get('retrieval_ms', (time.perf_counter() - started) * 1000), 1),
+            'llm_ms': usage.get('llm_ms', 0.0),
+            'total_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+        return response
+    
+    def _collect_passages(self, documents, documents_content):
+        """
+        Split the given documents into passages with their citations.
+        Near-duplicate passages are kept once, listing every document they appear in.
+        """
+        passages = []
+        sources = []
+        
+        for doc in documents:
+            content = doc.content
+            page_count = doc.page_count or 1
+            if content is None and str(doc.id) in documents_content:
+                content = documents_content[str(doc.id)]['content']
+                page_count = documents_content[str(doc.id)].get('page_count', 1)
+            
+            if not content:
+                continue
+            
+            doc_passages = split_into_passages(content, Config.PASSAGE_MAX_CHARS)
+            if Config.DEDUP_ENABLED:
+                signatures = self.dedup.decode_signatures(doc.block_signatures) if doc.block_signatures else []
+                if len(signatures) != len(doc_passages):
+                    # Stored before signatures existed or with different passage settings
+                    signatures = [self.dedup.signature(passage['content']) for passage in doc_passages]
+                for passage, signature in zip(doc_passages, signatures):
+                    passage['signature'] = signature
+            
+            for passage in doc_passages:
+                passage['document_name'] = doc.original_filename
+                passage['upload_date'] = doc.upload_date
+            passages.extend(doc_passages)
+            
+            sources.append({
+                'document_name': doc.original_filename,
+                'page_count': page_count
+            })
+        
+        original_chars = sum(len(passage['content']) for passage in passages)
+        chars_removed = 0
+        if Config.DEDUP_ENABLED and passages:
+            passages, chars_removed = self.dedup.deduplicate(passages)
+        
+        dedup_report = {
+            'passages_removed': sum(len(passage.get('duplicates', [])) for passage in passages),
+            'chars_saved': chars_removed,
+            'tokens_saved': chars_removed // 4,
+            'original_chars': original_chars
+        }
+        if chars_removed:
+            logger.info(f"Deduplication removed {chars_removed} of {original_chars} characters from the context")
+        
+        return passages, sources, dedup_report
+    
+    def _format_context_parts(self, passages):
+        """
+        Group passages back per document, keeping page markers, one context part per document
+        """
+        parts = {}
+        location = {}
+        for passage in passages:
+            name = passage['document_name']
+            if name not in parts:
+                parts[name] = [f"\n--- Document: {name} ---\n"]
+            
+            marker = f"Page {passage['page_number']}" if passage['page_number'] else passage['section']
+            if location.get(name) != marker:
+                parts[name].append(f"--- {marker} ---\n")
+                location[name] = marker
+            
+            parts[name].append(passage['content'] + "\n")
+            if passage.get('duplicates'):
+                also_in = "; ".join(
+                    f"{duplicate['document_name']}, Page {duplicate['page_number'] or 'n/a'}"
+                    for duplicate in passage['duplicates']
+                )
+                parts[name].append(f"[Also appears in: {also_in}]\n")
+        
+        return ["".join(part) for part in parts.values()]
+    
     def delete_document(self, document_id, session_id):
         """
         Delete a document
@@ -173,8 +687,9 @@ class DocumentProcessor:
             if not document:
                 raise ValueError("Document not found")
             
-            # Delete document from database
-            db.session.delete(document)
+            # Delete document with its chunks, search entries and file
+            from services.janitor import JanitorService
+            JanitorService().remove_document(document)
             db.session.commit()
             
             logger.info(f"Deleted document {document_id}")
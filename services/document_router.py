@@ -0,0 +1,59 @@
+import math
+import logging
+from collections import Counter
+from config import Config
+from services.text_utils import tokenize
+
+logger = logging.getLogger(__name__)
+
+class DocumentRouter:
+    def __init__(self, max_documents=None):
+        self.max_documents = max_documents or Config.ROUTING_MAX_DOCUMENTS
+
+    def select_documents(self, query, documents):
+        """
+        Pick the documents whose summaries best match the query.
+        Documents without a summary yet are always kept, since they can't be judged.
+        """
+        if len(documents) <= self.max_documents:
+            return documents
+
+        query_terms = set(tokenize(query))
+        summarized = [doc for doc in documents if doc.summary]
+        unsummarized = [doc for doc in documents if not doc.summary]
+
+        if not query_terms or not summarized:
+            return documents
+
+        # Term sets per document, built from the summary and the file name
+        doc_terms = {
+            doc.id: Counter(tokenize(f"{doc.original_filename} {doc.summary}"))
+            for doc in summarized
+        }
+
+        # Inverse document frequency over the summaries
+        document_frequency = Counter()
+        for terms in doc_terms.values():
+            document_frequency.update(query_terms & terms.keys())
+
+        total = len(summarized)
+        scored = []
+        for doc in summarized:
+            terms = doc_terms[doc.id]
+            length = sum(terms.values()) or 1
+            score = 0.0
+            for term in query_terms:
+                if term in terms:
+                    idf = math.log(1 + (total - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                    score += idf * terms[term] / (terms[term] + 0.5 + length / 100)
+            scored.append((score, doc))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        selected = [doc for score, doc in scored[:self.max_documents] if score > 0]
+
+        # Nothing matched the summaries, so routing can't narrow things down
+        if not selected:
+            return documents
+
+        logger.info(f"Routed query to {len(selected)} of {total} summarized documents")
+        return selected + unsummarized
@@ -0,0 +1,112 @@
+import re
+import math
+import time
+import logging
+from collections import Counter
+from config import Config
+from services.text_utils import tokenize
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+
+class ExtractiveAnswerer:
+    """
+    Answers lookup-style questions with a single sentence of the stored text.
+    Sentences of the retrieved passages are scored by how much of the question's
+    (IDF-weighted) terms they cover; only a clear, confident winner is returned,
+    otherwise the question goes to the LLM as usual. A sentence has to say
+    something beyond the question's own terms, so headings that merely repeat
+    the question are never returned as answers.
+    """
+    def __init__(self, min_confidence=None, min_margin=None):
+        self.min_confidence = min_confidence or Config.EXTRACTIVE_MIN_CONFIDENCE
+        self.min_margin = min_margin if min_margin is not None else Config.EXTRACTIVE_MIN_MARGIN
+    
+    def answer(self, query, passages):
+        """
+        Return a response dict built from the best matching sentence,
+        or None when no sentence answers the question confidently.
+        """
+        started = time.perf_counter()
+        query_terms = set(tokenize(query))
+        
+        # One-word and long, open questions are not lookups
+        if len(query_terms) < 2 or len(query_terms) > Config.EXTRACTIVE_MAX_QUESTION_TERMS or not passages:
+            return None
+        
+        sentences = self._split_sentences(passages)
+        if not sentences:
+            return None
+        
+        # Weight question terms by how rare they are among the candidate sentences
+        document_frequency = Counter()
+        for sentence in sentences:
+            document_frequency.update(query_terms & sentence['terms'])
+        total = len(sentences)
+        idf = {
+            term: math.log(1 + (total - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            for term in query_terms
+        }
+        query_weight = sum(idf.values())
+        
+        scored = []
+        for sentence in sentences:
+            matched = query_terms & sentence['terms']
+            if not matched or len(sentence['terms'] - query_terms) < Config.EXTRACTIVE_MIN_ANSWER_TERMS:
+                continue
+            coverage = sum(idf[term] for term in matched) / query_weight
+            scored.append((coverage, sentence))
+        
+        if not scored:
+            return None
+        
+        # Stable sort: sentences with equal coverage keep the retrieval order of their passages
+        scored.sort(key=lambda item: item[0], reverse=True)
+        confidence, best = scored[0]
+        runner_up = next(
+            (coverage for coverage, sentence in scored[1:] if sentence['text'] != best['text']),
+            0.0
+        )
+        
+        extractive_ms = (time.perf_counter() - started) * 1000
+        if confidence < self.min_confidence or confidence - runner_up < self.min_margin:
+            logger.debug(
+                f"No extractive answer (confidence {confidence:.2f}, margin {confidence - runner_up:.2f})"
+            )
+            return None
+        
+        passage = best['passage']
+        logger.info(f"Answered extractively in {extractive_ms:.1f} ms (confidence {confidence:.2f})")
+        
+        return {
+            "response": best['text'],
+            "sources": [{
+                'document_name': passage['document_name'],
+                'page_number': passage['page_number'] or 'n/a',
+                'section': passage['section'] or f"Page {passage['page_number']}"
+            }],
+            "context_used": 1,
+            "mode": "extractive",
+            "confidence": round(confidence, 3),
+            "llm_followup": Config.EXTRACTIVE_LLM_FOLLOWUP,
+            "timings": {
+                "extractive_ms": round(extractive_ms, 2)
+            }
+        }
+    
+    def _split_sentences(self, passages):
+        """
+        Sentences of the given passages with their term sets, keeping the passage for citations
+        """
+        sentences = []
+        for passage in passages:
+            for line in passage['content'].splitlines():
+                for text in SENTENCE_BOUNDARY.split(line.strip()):
+                    text = text.strip()
+                    if not text or len(text) > Config.EXTRACTIVE_MAX_SENTENCE_CHARS:
+                        continue
+                    terms = set(tokenize(text))
+                    if terms:
+                        sentences.append({'text': text, 'terms': terms, 'passage': passage})
+        return sentences
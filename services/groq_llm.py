@@ -1,17 +1,42 @@
 import json
+import time
 import logging
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
 from config import Config
+from services.admission import llm_admission, AdmissionRejected
+from services.deadline import DeadlineExceeded, LatencyTracker
+from services.text_utils import estimate_tokens, split_text
+from services.tracing import tracer, bind_context
 
 logger = logging.getLogger(__name__)
 
+# GROQ responses that may succeed when the request is sent again later
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class TransientLLMError(Exception):
+    """
+    A GROQ request failed in a way that may succeed when retried: rate limits,
+    server errors, timeouts and connection failures
+    """
+    pass
+
+# Shared by all threads of the worker so connections to GROQ are kept alive and reused
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=Config.HTTP_POOL_SIZE))
+
+# Recent GROQ latencies and the threads running hedged attempts
+groq_latency = LatencyTracker()
+hedge_executor = ThreadPoolExecutor(max_workers=Config.HTTP_POOL_SIZE, thread_name_prefix="groq-hedge")
+
 class GroqLLMService:
     def __init__(self):
         self.api_key = Config.GROQ_API_KEY
         if not self.api_key:
             raise ValueError("GROQ API key not configured")
         
-        self.base_url = "https://api.groq.com/openai/v1"
+        self.base_url = Config.GROQ_BASE_URL
         self.model = "llama-3.1-8b-instant"  # Using Llama 3.1 8B model
         
         self.system_prompt = """
@@ -22,7 +47,7 @@ Be concise but thorough in your responses.
 Format your citations as [Document: filename.pdf, Page: X].
 """
     
-    def generate_response_from_context(self, user_query, context, sources):
+    def generate_response_from_context(self, user_query, context, sources, deadline=None):
         """
         Generate response using GROQ LLM based on search results
         """
@@ -37,7 +62,232 @@ Question: {user_query}
 Please provide a comprehensive answer based on the context above. Include specific citations by mentioning the document names.
 """
             
-            # Prepare the API request
+            generated_response, usage = self._chat_completion([
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": user_prompt}
+            ], deadline=deadline)
+            
+            logger.info(f"Generated response for query: {user_query[:50]}...")
+            
+            return {
+                "response": generated_response,
+                "sources": sources,
+                "context_used": len(sources),
+                "usage": usage
+            }
+            
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
+            raise
+    
+    def generate_map_reduce_response(self, user_query, context_parts, sources, deadline=None):
+        """
+        Answer over context that doesn't fit into one prompt.
+        Each window-sized shard is mapped to the facts relevant to the question
+        concurrently, then the partial answers are reduced into one response.
+        Shards whose call fails are skipped and reported in the response.
+        """
+        try:
+            budget = Config.LLM_CONTEXT_TOKEN_BUDGET
+            shards = self._partition_context(context_parts, budget)
+            logger.info(f"Map-reduce over {len(shards)} shards for query: {user_query[:50]}...")
+            
+            # Map phase: extract relevant facts from every shard in parallel
+            map_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=Config.MAP_REDUCE_MAX_WORKERS) as executor:
+                futures = [
+                    executor.submit(bind_context(self._extract_relevant_facts), user_query, shard, deadline)
+                    for shard in shards
+                ]
+                mapped = []
+                failed_shards = 0
+                for future in futures:
+                    try:
+                        mapped.append(future.result())
+                    except DeadlineExceeded:
+                        raise
+                    except Exception as e:
+                        failed_shards += 1
+                        error = e
+                        logger.warning(f"Skipping a map-reduce shard that failed: {str(e)}")
+            map_ms = (time.perf_counter() - map_start) * 1000
+            
+            # Answer from what could be read unless nothing could
+            if shards and failed_shards == len(shards):
+                raise error
+            
+            usages = [usage for partial, usage in mapped]
+            partials = [partial for partial, usage in mapped if partial]
+            
+            # Reduce phase: combine partial answers, re-partitioning if they still don't fit
+            reduce_start = time.perf_counter()
+            while len(partials) > 1 and estimate_tokens("\n\n".join(partials)) > budget:
+                groups = self._partition_context([partial + "\n\n" for partial in partials], budget)
+                if len(groups) == len(partials):
+                    # No two partials fit one prompt, so merging can't shrink them; give each an
+                    # equal share of the budget instead of overflowing the final prompt
+                    share = max(1, budget * 4 // len(partials) - 2)
+                    partials = [split_text(partial, share)[0] for partial in partials]
+                    logger.warning(f"Trimmed {len(partials)} partial answers to {share} characters each to fit the budget")
+                    break
+                combined = [
+                    self._combine_partial_answers(user_query, [group], final=False, deadline=deadline)
+                    for group in groups
+                ]
+                usages.extend(usage for partial, usage in combined)
+                partials = [partial for partial, usage in combined]
+            
+            if partials:
+                generated_response, usage = self._combine_partial_answers(
+                    user_query, partials, final=True, deadline=deadline
+                )
+                usages.append(usage)
+            else:
+                generated_response = "The documents don't contain information relevant to this question."
+            reduce_ms = (time.perf_counter() - reduce_start) * 1000
+            
+            if failed_shards:
+                generated_response += (
+                    f"\n\n(Note: {failed_shards} of {len(shards)} parts of the documents could not be read, "
+                    "so this answer may be incomplete.)"
+                )
+            
+            # Merge citations from all shards that contributed facts
+            cited_documents = {
+                source['document_name'] for source in sources
+                if source['document_name'] in generated_response
+            }
+            merged_sources = [
+                source for source in sources
+                if not cited_documents or source['document_name'] in cited_documents
+            ]
+            
+            logger.info(f"Map-reduce finished: map {map_ms:.0f} ms, reduce {reduce_ms:.0f} ms")
+            
+            # Token counts add up over all calls; latency is the wall time of both phases
+            usage = self._merge_usage(usages)
+            usage['llm_ms'] = round(map_ms + reduce_ms, 1)
+            
+            return {
+                "response": generated_response,
+                "sources": merged_sources,
+                "context_used": len(merged_sources),
+                "usage": usage,
+                "mode": "map_reduce",
+                "timings": {
+                    "shards": len(shards),
+                    "failed_shards": failed_shards,
+                    "map_ms": round(map_ms, 1),
+                    "reduce_ms": round(reduce_ms, 1)
+                }
+            }
+            
+        except Exception as e:
+            logger.error(f"Error generating map-reduce response: {str(e)}")
+            raise
+    
+    def _extract_relevant_facts(self, user_query, shard, deadline=None):
+        """
+        Map step: pull the facts relevant to the question out of one shard.
+        Returns the facts (None when nothing is relevant) and the call's usage.
+        """
+        user_prompt = f"""
+Context from documents:
+{shard}
+
+Question: {user_query}
+
+List only the facts from the context above that help answer the question, each with its citation.
+If nothing in the context is relevant, reply with exactly NONE.
+"""
+        facts, usage = self._chat_completion([
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": user_prompt}
+        ], deadline=deadline)
+        
+        if facts.strip().upper().startswith("NONE"):
+            return None, usage
+        return facts.strip(), usage
+    
+    def _combine_partial_answers(self, user_query, partials, final, deadline=None):
+        """
+        Reduce step: merge partial answers into one, keeping their citations.
+        Returns the merged text and the call's usage.
+        """
+        notes = "\n\n".join(f"Notes {i}:\n{partial}" for i, partial in enumerate(partials, 1))
+        instruction = (
+            "Please provide a comprehensive answer to the question using these notes. Keep all citations."
+            if final else
+            "Merge these notes into one list of facts relevant to the question. Keep all citations."
+        )
+        user_prompt = f"""
+Notes extracted from different parts of the documents:
+{notes}
+
+Question: {user_query}
+
+{instruction}
+"""
+        return self._chat_completion([
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": user_prompt}
+        ], deadline=deadline)
+    
+    def _partition_context(self, context_parts, budget_tokens):
+        """
+        Pack context parts into shards that each fit the token budget.
+        Parts larger than the budget are split on line boundaries, and lines
+        longer than a shard are split into several.
+        """
+        max_chars = budget_tokens * 4
+        pieces = []
+        for part in context_parts:
+            if len(part) <= max_chars:
+                pieces.append(part)
+                continue
+            
+            # Repeat the part's header (e.g. the document name) on every piece
+            header = part.strip().splitlines()[0][:200] + " (continued)\n"
+            line_chars = max_chars - len(header)
+            piece = ""
+            for line in part.splitlines(keepends=True):
+                segments = [line]
+                if len(line) > line_chars:
+                    segments = [segment + "\n" for segment in split_text(line.rstrip("\n"), line_chars - 1)]
+                for segment in segments:
+                    if piece and len(piece) + len(segment) > max_chars:
+                        pieces.append(piece)
+                        piece = header
+                    piece += segment
+            if piece:
+                pieces.append(piece)
+        
+        shards = []
+        shard = ""
+        for piece in pieces:
+            if shard and len(shard) + len(piece) > max_chars:
+                shards.append(shard)
+                shard = ""
+            shard += piece
+        if shard:
+            shards.append(shard)
+        
+        return shards
+    
+    def _chat_completion(self, messages, max_tokens=1024, temperature=0.1, deadline=None, queue_timeout=None):
+        """
+        Send a chat completion request to GROQ.
+        Returns the generated text and the call's token usage and latency.
+        The call never waits longer than the request deadline allows. Every
+        request sent to GROQ holds an LLM admission slot while it runs, so
+        LLM_MAX_CONCURRENT caps map-reduce shards and hedged attempts too, and
+        the slot is charged to the session the request is answered for.
+        """
+        try:
+            started = time.perf_counter()
+            if deadline is not None:
+                deadline.check("calling GROQ")
+            
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
@@ -45,52 +295,138 @@ Please provide a comprehensive answer based on the context above. Include specif
             
             payload = {
                 "model": self.model,
-                "messages": [
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "temperature": 0.1,
-                "max_tokens": 1024,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
                 "top_p": 1,
                 "stream": False
             }
             
+            if queue_timeout is None:
+                queue_timeout = Config.LLM_QUEUE_TIMEOUT
+            # Waiting on the session's own calls holds up no one else, so it may take the whole budget
+            session_timeout = queue_timeout
+            if deadline is not None:
+                queue_timeout = deadline.timeout(queue_timeout)
+                session_timeout = deadline.remaining()
+            
+            with tracer.span('groq.chat_completion', model=self.model, max_tokens=max_tokens,
+                             request_bytes=sum(len(message['content']) for message in messages)) as span:
+                release = llm_admission.acquire(timeout=queue_timeout, session_timeout=session_timeout)
+                if Config.GROQ_HEDGE_ENABLED and len(groq_latency) >= Config.GROQ_HEDGE_MIN_SAMPLES:
+                    result = self._post_hedged(release, headers, payload, deadline)
+                else:
+                    result = self._post_admitted(release, headers, payload, deadline)
+                
+                if 'choices' not in result or not result['choices']:
+                    raise Exception("No response generated by GROQ")
+                
+                usage = result.get('usage') or {}
+                span.set_attribute('prompt_tokens', usage.get('prompt_tokens', 0))
+                span.set_attribute('completion_tokens', usage.get('completion_tokens', 0))
+            return result['choices'][0]['message']['content'], {
+                "model": result.get('model', self.model),
+                "prompt_tokens": usage.get('prompt_tokens', 0),
+                "completion_tokens": usage.get('completion_tokens', 0),
+                "llm_ms": round((time.perf_counter() - started) * 1000, 1),
+                "llm_calls": 1
+            }
+            
+        except requests.exceptions.Timeout:
+            if deadline is not None and deadline.expired():
+                logger.error("GROQ API request ran past the request deadline")
+                raise DeadlineExceeded("The answer took too long. Please try again.")
+            logger.error("GROQ API request timed out")
+            raise TransientLLMError("Request timed out. Please try again.")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"GROQ API request error: {str(e)}")
+            raise TransientLLMError(f"Failed to connect to GROQ API: {str(e)}")
+    
+    def _post_completion(self, headers, payload, deadline=None):
+        """
+        One completion request, timed out at the remaining request budget
+        """
+        timeout = deadline.timeout(Config.GROQ_TIMEOUT) if deadline is not None else Config.GROQ_TIMEOUT
+        started = time.perf_counter()
+        
+        with tracer.span('groq.http', timeout_s=round(timeout, 2)) as span:
             # Make the API request
-            response = requests.post(
+            response = http_session.post(
                 f"{self.base_url}/chat/completions",
                 headers=headers,
                 json=payload,
-                timeout=30
+                timeout=timeout
             )
+            span.set_attribute('status_code', response.status_code)
+            span.set_attribute('response_bytes', len(response.content))
             
             if response.status_code != 200:
                 logger.error(f"GROQ API error: {response.status_code} - {response.text}")
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    raise TransientLLMError(f"GROQ API request failed: {response.status_code}")
                 raise Exception(f"GROQ API request failed: {response.status_code}")
-            
-            result = response.json()
-            
-            if 'choices' not in result or not result['choices']:
-                raise Exception("No response generated by GROQ")
-            
-            generated_response = result['choices'][0]['message']['content']
-            
-            logger.info(f"Generated response for query: {user_query[:50]}...")
-            
-            return {
-                "response": generated_response,
-                "sources": sources,
-                "context_used": len(sources)
-            }
-            
-        except requests.exceptions.Timeout:
-            logger.error("GROQ API request timed out")
-            raise Exception("Request timed out. Please try again.")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"GROQ API request error: {str(e)}")
-            raise Exception(f"Failed to connect to GROQ API: {str(e)}")
-        except Exception as e:
-            logger.error(f"Error generating response: {str(e)}")
-            raise
+        
+        groq_latency.record(time.perf_counter() - started)
+        return response.json()
+    
+    def _post_admitted(self, release, headers, payload, deadline=None):
+        """
+        One completion request on an admission slot taken by the caller; the
+        slot is released when the request ends, on whichever thread runs it
+        """
+        try:
+            return self._post_completion(headers, payload, deadline)
+        finally:
+            release()
+    
+    def _post_hedged(self, release, headers, payload, deadline=None):
+        """
+        Start a second identical request when the first is slower than the recent
+        p95 latency, and use whichever finishes first. The slower request is left
+        to finish in the background and its result is discarded. The second
+        request needs a free admission slot of its own and is skipped without one.
+        """
+        hedge_delay = groq_latency.percentile(0.95)
+        attempts = [hedge_executor.submit(bind_context(self._post_admitted), release, headers, payload, deadline)]
+        
+        done, _ = wait(attempts, timeout=hedge_delay)
+        if not done and (deadline is None or deadline.remaining() > 0):
+            hedge_release = llm_admission.try_acquire()
+            if hedge_release is None:
+                logger.info("GROQ request slower than p95 but no capacity for a hedged request")
+            else:
+                logger.info(f"GROQ request slower than p95 ({hedge_delay:.2f}s), sending hedged request")
+                tracer.current_span().set_attribute('hedged', True)
+                attempts.append(hedge_executor.submit(
+                    bind_context(self._post_admitted), hedge_release, headers, payload, deadline
+                ))
+        
+        # Take the first attempt that succeeds; fail only when all of them fail
+        pending = set(attempts)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result()
+                error = attempt.exception()
+        raise error
+    
+    def _merge_usage(self, usages):
+        """
+        Add up the usage of several completion calls
+        """
+        merged = {
+            "model": self.model,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "llm_ms": 0.0,
+            "llm_calls": 0
+        }
+        for usage in usages:
+            for key in ("prompt_tokens", "completion_tokens", "llm_ms", "llm_calls"):
+                merged[key] += usage.get(key, 0)
+        return merged
     
     def _build_context(self, search_results):
         """
@@ -101,14 +437,19 @@ Please provide a comprehensive answer based on the context above. Include specif
         for i, result in enumerate(search_results, 1):
             content = result['content']
             doc_name = result['document_name']
-            page_num = result.get('page_number', 'Unknown')
+            page_num = result.get('page_number') or 'Unknown'
             section = result.get('section', '')
+            also_in = "; ".join(
+                f"{duplicate['document_name']}, Page {duplicate['page_number'] or 'Unknown'}"
+                for duplicate in result.get('duplicates', [])
+            )
             
             context_part = f"""
 Source {i}:
 Document: {doc_name}
 Page: {page_num}
 {f"Section: {section}" if section else ""}
+{f"Also appears in: {also_in}" if also_in else ""}
 Content: {content}
 ---
 """
@@ -124,62 +465,46 @@ Content: {content}
         seen_sources = set()
         
         for result in search_results:
-            source_key = f"{result['document_name']}_{result.get('page_number', 1)}"
-            if source_key not in seen_sources:
-                sources.append({
-                    "document_name": result['document_name'],
-                    "page_number": result.get('page_number', 1),
-                    "section": result.get('section', ''),
-                    "relevance_score": result.get('score', 0)
-                })
-                seen_sources.add(source_key)
+            # Passages deduplicated across documents cite every copy
+            citations = [result] + result.get('duplicates', [])
+            for citation in citations:
+                page_number = citation.get('page_number') or 'n/a'
+                source_key = f"{citation['document_name']}_{page_number}"
+                if source_key not in seen_sources:
+                    sources.append({
+                        "document_name": citation['document_name'],
+                        "page_number": page_number,
+                        "section": result.get('section', ''),
+                        "relevance_score": result.get('rerank_score', result.get('score', 0))
+                    })
+                    seen_sources.add(source_key)
         
         return sources
     
-    def generate_summary(self, document_content, document_name):
+    def generate_summary(self, document_content, document_name, queue_timeout=None):
         """
         Generate a summary of a document
+        Returns None when no summary could be generated; failures worth
+        retrying (AdmissionRejected, TransientLLMError) are raised instead
         """
         try:
+            # Limit content to avoid token limits
             summary_prompt = f"""
 Please provide a concise summary of the following document content from {document_name}:
 
-{document_content[:4000]}  # Limit content to avoid token limits
+{document_content[:Config.SUMMARY_INPUT_CHARS]}
 
 Summary should be 2-3 paragraphs highlighting the main topics and key information.
 """
             
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": "You are a helpful assistant that creates concise document summaries."},
-                    {"role": "user", "content": summary_prompt}
-                ],
-                "temperature": 0.3,
-                "max_tokens": 300,
-                "top_p": 1,
-                "stream": False
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if 'choices' in result and result['choices']:
-                    return result['choices'][0]['message']['content']
-            
-            return "Summary generation failed"
+            summary, usage = self._chat_completion([
+                {"role": "system", "content": "You are a helpful assistant that creates concise document summaries."},
+                {"role": "user", "content": summary_prompt}
+            ], max_tokens=300, temperature=0.3, queue_timeout=queue_timeout)
+            return summary
             
+        except (AdmissionRejected, TransientLLMError):
+            raise
         except Exception as e:
             logger.error(f"Error generating summary: {str(e)}")
-            return "Summary not available"
+            return None
@@ -0,0 +1,313 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from config import Config
+from models import (
+    Document, DocumentChunk, DocumentPage, DocumentVersion, ExtractedTable, KeyValuePair, ChatSession, ChatMessage
+)
+from app import db
+
+# Optional dependency: without it (Windows) runs are only serialized within a process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class JanitorService:
+    """
+    Expires old rows, removes orphaned files and search entries, and keeps the
+    database compact. Deletes run in small batches, each in its own short
+    transaction, so cleanup never holds long table locks.
+    """
+    last_report = None
+    _last_maintenance = None
+    _lock = threading.Lock()
+    _started = False
+    _owner_lock = None
+    
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or Config.JANITOR_BATCH_SIZE
+        self._search_service = None
+        self._search_unavailable = False
+    
+    def start(self, app):
+        """
+        Run the janitor periodically on a background thread. Of several worker
+        processes only the first to get the lock file runs it; the lock is
+        released when that process exits, so its replacement takes over.
+        """
+        if JanitorService._started:
+            return None
+        with JanitorService._lock:
+            if JanitorService._started:
+                return None
+            JanitorService._started = True
+            
+            JanitorService._owner_lock = _try_lock(Config.JANITOR_LOCK_FILE)
+            if JanitorService._owner_lock is None:
+                logger.info("Janitor runs in another process")
+                return None
+        
+        thread = threading.Thread(target=self._run_forever, args=(app,), daemon=True)
+        thread.start()
+        logger.info(f"Janitor started, running every {Config.JANITOR_INTERVAL_SECONDS} seconds")
+        return thread
+    
+    def _run_forever(self, app):
+        while True:
+            time.sleep(Config.JANITOR_INTERVAL_SECONDS)
+            with app.app_context():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error(f"Janitor run failed: {str(e)}")
+                    db.session.rollback()
+    
+    def run_once(self):
+        """
+        Run every cleanup step once and return what was reclaimed
+        """
+        # Only one run at a time, also across processes (e.g. 'flask janitor' next to the server)
+        run_lock = _try_lock(f"{Config.JANITOR_LOCK_FILE}.run")
+        if run_lock is None:
+            logger.info("Janitor run already in progress, skipping")
+            return None
+        
+        try:
+            started = time.perf_counter()
+            now = datetime.utcnow()
+            report = {
+                'chat_messages': 0,
+                'chat_sessions': 0,
+                'documents': 0,
+                'chunks': 0,
+                'search_entries': 0,
+                'files': 0,
+                'bytes_freed': 0,
+                'maintenance': None
+            }
+            
+            if Config.CHAT_MESSAGE_TTL_DAYS:
+                cutoff = now - timedelta(days=Config.CHAT_MESSAGE_TTL_DAYS)
+                report['chat_messages'] = self._delete_in_batches(ChatMessage, ChatMessage.timestamp < cutoff)
+            
+            if Config.CHAT_SESSION_TTL_DAYS:
+                cutoff = now - timedelta(days=Config.CHAT_SESSION_TTL_DAYS)
+                report['chat_sessions'] = self._delete_in_batches(ChatSession, ChatSession.created_at < cutoff)
+            
+            if Config.DOCUMENT_TTL_DAYS:
+                # Documents of sessions that haven't been used for the whole period
+                cutoff = now - timedelta(days=Config.DOCUMENT_TTL_DAYS)
+                recently_used = db.select(ChatMessage.session_id).where(ChatMessage.timestamp >= cutoff)
+                self._expire_documents(
+                    (Document.upload_date < cutoff) & ~Document.session_id.in_(recently_used),
+                    report
+                )
+            
+            if Config.FAILED_DOCUMENT_TTL_HOURS:
+                cutoff = now - timedelta(hours=Config.FAILED_DOCUMENT_TTL_HOURS)
+                self._expire_documents(
+                    (Document.status == 'error') & (Document.upload_date < cutoff),
+                    report
+                )
+            
+            report['chunks'] += self._delete_in_batches(
+                DocumentChunk,
+                ~DocumentChunk.document_id.in_(db.select(Document.id))
+            )
+            
+            if Config.ORPHAN_FILE_TTL_HOURS:
+                self._sweep_orphan_files(now - timedelta(hours=Config.ORPHAN_FILE_TTL_HOURS), report)
+            
+            report['maintenance'] = self._maintain_database(now)
+            report['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            
+            JanitorService.last_report = dict(report, finished_at=now.isoformat())
+            logger.info(f"Janitor reclaimed: {report}")
+            return report
+        
+        finally:
+            run_lock.release()
+    
+    def _delete_in_batches(self, model, condition):
+        """
+        Delete matching rows a batch at a time, committing after each batch
+        """
+        deleted = 0
+        while True:
+            ids = [row[0] for row in db.session.query(model.id).filter(condition).limit(self.batch_size).all()]
+            if not ids:
+                break
+            
+            model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            deleted += len(ids)
+        
+        return deleted
+    
+    def _expire_documents(self, condition, report):
+        """
+        Remove matching documents together with their chunks, search entries and files
+        """
+        while True:
+            documents = Document.query.filter(condition).limit(self.batch_size).all()
+            if not documents:
+                break
+            
+            for document in documents:
+                removed = self.remove_document(document)
+                report['chunks'] += removed['chunks']
+                report['search_entries'] += removed['search_entries']
+                report['files'] += removed['files']
+                report['bytes_freed'] += removed['bytes_freed']
+            db.session.commit()
+            report['documents'] += len(documents)
+    
+    def remove_document(self, document):
+        """
+        Delete a document and everything that belongs to it.
+        The caller commits the session.
+        """
+        removed = {'chunks': 0, 'search_entries': 0, 'files': 0, 'bytes_freed': 0}
+        
+        removed['chunks'] = DocumentChunk.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+        ExtractedTable.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+        KeyValuePair.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+        DocumentPage.query.filter(
+            DocumentPage.version_id.in_(db.select(DocumentVersion.id).filter_by(document_id=document.id))
+        ).delete(synchronize_session=False)
+        DocumentVersion.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+        removed['search_entries'] = self._delete_search_entries(document.id)
+        
+        if document.file_path and os.path.exists(document.file_path):
+            try:
+                size = os.path.getsize(document.file_path)
+                os.remove(document.file_path)
+                removed['files'] = 1
+                removed['bytes_freed'] = size
+            except OSError as e:
+                logger.warning(f"Could not remove file {document.file_path}: {e}")
+        
+        db.session.delete(document)
+        return removed
+    
+    def _delete_search_entries(self, document_id):
+        """
+        Delete a document's entries from Azure Search when it is configured
+        """
+        if self._search_unavailable or not Config.AZURE_SEARCH_ENDPOINT or not Config.AZURE_SEARCH_KEY:
+            return 0
+        
+        try:
+            if self._search_service is None:
+                from services.azure_search import AzureSearchService
+                self._search_service = AzureSearchService()
+            return self._search_service.delete_document_chunks(document_id)
+        except Exception as e:
+            # Don't keep retrying an unreachable search service for every document
+            logger.warning(f"Could not delete search entries for document {document_id}: {str(e)}")
+            self._search_unavailable = True
+            return 0
+    
+    def _sweep_orphan_files(self, cutoff, report):
+        """
+        Remove upload files that no document still being processed refers to
+        """
+        from flask import current_app
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        if not os.path.isdir(upload_folder):
+            return
+        
+        in_use = {
+            os.path.normpath(row[0])
+            for row in db.session.query(Document.file_path).filter(Document.status == 'processing').all()
+        }
+        cutoff_timestamp = cutoff.timestamp()
+        
+        for entry in os.scandir(upload_folder):
+            if not entry.is_file() or os.path.normpath(entry.path) in in_use:
+                continue
+            
+            try:
+                stat = entry.stat()
+                if stat.st_mtime >= cutoff_timestamp:
+                    continue
+                os.remove(entry.path)
+                report['files'] += 1
+                report['bytes_freed'] += stat.st_size
+            except OSError as e:
+                logger.warning(f"Could not remove orphan file {entry.path}: {e}")
+    
+    def _maintain_database(self, now):
+        """
+        Reclaim free space and refresh planner statistics at most once per interval
+        """
+        if not Config.DB_MAINTENANCE_INTERVAL_HOURS:
+            return None
+        
+        last = JanitorService._last_maintenance
+        if last and now - last < timedelta(hours=Config.DB_MAINTENANCE_INTERVAL_HOURS):
+            return None
+        
+        dialect = db.engine.dialect.name
+        try:
+            # VACUUM can't run inside a transaction block
+            with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                if dialect == 'sqlite':
+                    connection.execute(text("VACUUM"))
+                    connection.execute(text("ANALYZE"))
+                elif dialect == 'postgresql':
+                    # Plain VACUUM doesn't take exclusive locks, unlike VACUUM FULL
+                    connection.execute(text("VACUUM (ANALYZE)"))
+                else:
+                    return None
+        except Exception as e:
+            logger.warning(f"Database maintenance failed: {str(e)}")
+            return None
+        
+        JanitorService._last_maintenance = now
+        return dialect
+
+class _ProcessLock:
+    """
+    An exclusive lock on a file, held until released or the process exits
+    """
+    def __init__(self, file, thread_lock=None):
+        self.file = file
+        self.thread_lock = thread_lock
+    
+    def release(self):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+        if self.thread_lock is not None:
+            self.thread_lock.release()
+
+_thread_locks = {}
+
+def _try_lock(path):
+    """
+    Take the lock for path without waiting, or return None when it is held
+    """
+    thread_lock = _thread_locks.setdefault(path, threading.Lock())
+    if not thread_lock.acquire(blocking=False):
+        return None
+    if fcntl is None:
+        return _ProcessLock(None, thread_lock)
+    
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        thread_lock.release()
+        return None
+    return _ProcessLock(lock_file, thread_lock)
@@ -0,0 +1,160 @@
+import io
+import os
+import time
+import logging
+from config import Config
+
+# Optional dependencies: without them files are sent to Azure unchanged
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+class PayloadOptimizer:
+    """
+    Shrinks files before they are sent to Document Intelligence: images are
+    downscaled to the resolution OCR needs, re-encoded and stripped of metadata;
+    PDFs get their embedded images downscaled and, optionally, blank pages dropped.
+    """
+    def optimize(self, file_path, filename):
+        """
+        Write an optimized copy of the file when that saves enough bytes.
+        Returns a dict with the path to send ('path', the original if nothing
+        was saved), byte counts, the original page numbers of the pages kept
+        ('page_numbers', None when all pages are kept) and the time taken.
+        """
+        started = time.perf_counter()
+        original_bytes = os.path.getsize(file_path)
+        result = {
+            'path': file_path,
+            'original_bytes': original_bytes,
+            'optimized_bytes': original_bytes,
+            'page_numbers': None,
+            'elapsed_ms': 0.0
+        }
+        
+        if not Config.PAYLOAD_OPTIMIZATION_ENABLED:
+            return result
+        
+        extension = os.path.splitext(filename.lower())[1]
+        try:
+            if extension in ('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.gif') and Image is not None:
+                data, page_numbers = self._optimize_image(file_path), None
+            elif extension == '.pdf' and PdfReader is not None and Image is not None:
+                data, page_numbers = self._optimize_pdf(file_path)
+            else:
+                return result
+        except Exception as e:
+            logger.warning(f"Could not optimize {filename}, sending it unchanged: {str(e)}")
+            return result
+        
+        result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        
+        # Keep the original unless the copy is meaningfully smaller or drops pages
+        if data is None or (
+            page_numbers is None and len(data) > original_bytes * (1 - Config.PAYLOAD_MIN_SAVINGS_RATIO)
+        ):
+            return result
+        
+        optimized_path = f"{file_path}.optimized{'.pdf' if extension == '.pdf' else '.jpg'}"
+        with open(optimized_path, 'wb') as optimized_file:
+            optimized_file.write(data)
+        
+        result['path'] = optimized_path
+        result['optimized_bytes'] = len(data)
+        result['page_numbers'] = page_numbers
+        logger.info(
+            f"Optimized {filename}: {original_bytes} -> {len(data)} bytes "
+            f"in {result['elapsed_ms']} ms"
+        )
+        return result
+    
+    def _optimize_image(self, file_path):
+        """
+        Downscale, flatten and re-encode an image as a metadata-free JPEG
+        """
+        with Image.open(file_path) as image:
+            image = ImageOps.exif_transpose(image)
+            image = self._downscale(image, Config.IMAGE_MAX_DIMENSION)
+            
+            if Config.IMAGE_GRAYSCALE:
+                image = image.convert('L')
+            elif image.mode in ('RGBA', 'LA', 'P'):
+                # JPEG has no alpha channel; flatten onto white like a printed page
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+            
+            # Saving without exif/icc arguments drops all metadata
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=Config.IMAGE_JPEG_QUALITY, optimize=True)
+            return output.getvalue()
+    
+    def _optimize_pdf(self, file_path):
+        """
+        Downscale oversized embedded images and optionally drop blank pages.
+        Returns the new PDF bytes and the original numbers of the kept pages.
+        """
+        reader = PdfReader(file_path)
+        writer = PdfWriter()
+        kept_pages = []
+        
+        for page_number, page in enumerate(reader.pages, start=1):
+            if Config.PDF_DROP_BLANK_PAGES and self._is_blank(page):
+                continue
+            writer.add_page(page)
+            kept_pages.append(page_number)
+        
+        if not kept_pages:
+            return None, None
+        
+        for page in writer.pages:
+            for embedded in page.images:
+                image = embedded.image
+                if max(image.size) <= Config.PDF_IMAGE_MAX_DIMENSION:
+                    continue
+                image = self._downscale(image, Config.PDF_IMAGE_MAX_DIMENSION)
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                embedded.replace(image, quality=Config.IMAGE_JPEG_QUALITY)
+        
+        writer.compress_identical_objects()
+        output = io.BytesIO()
+        writer.write(output)
+        
+        page_numbers = kept_pages if len(kept_pages) < len(reader.pages) else None
+        if page_numbers:
+            logger.info(f"Dropped {len(reader.pages) - len(kept_pages)} blank pages")
+        return output.getvalue(), page_numbers
+    
+    def _is_blank(self, page):
+        """
+        A page with no text and no images
+        """
+        if (page.extract_text() or "").strip():
+            return False
+        resources = page.get('/Resources')
+        if resources is None:
+            return True
+        x_objects = resources.get_object().get('/XObject')
+        return x_objects is None or len(x_objects.get_object()) == 0
+    
+    def _downscale(self, image, max_dimension):
+        """
+        Shrink an image so its longer side is at most max_dimension
+        """
+        if max(image.size) <= max_dimension:
+            return image
+        scale = max_dimension / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.LANCZOS)
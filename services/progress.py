@@ -0,0 +1,119 @@
+import time
+import logging
+import secrets
+import threading
+from collections import deque
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Stages after which a document has nothing more in flight
+FINAL_STAGES = {'indexed', 'error'}
+
+class ProgressBroker:
+    """
+    Pushes document processing progress to listeners within a worker process.
+    Each session keeps a short history of numbered events; listeners wait on a
+    condition for events after the last one they saw, so nothing polls the
+    database while documents are processed. Event numbers only mean something
+    in the process that issued them, which event_id() and parse_event_id() encode.
+    """
+    def __init__(self, history=None, idle_session_seconds=3600):
+        self.history = history or Config.PROGRESS_HISTORY
+        self.idle_session_seconds = idle_session_seconds
+        self.process_id = secrets.token_hex(4)
+        self._condition = threading.Condition()
+        self._sequence = 0
+        self._events = {}
+        self._evicted = {}
+        self._last_event = {}
+        self._active_documents = set()
+    
+    def publish(self, session_id, document_id, status, stage, message=None, **details):
+        """
+        Record a progress event and wake up the listeners
+        """
+        with self._condition:
+            self._sequence += 1
+            event = {
+                'id': self._sequence,
+                'document_id': document_id,
+                'status': status,
+                'stage': stage,
+                'message': message,
+                'time': time.time(),
+                **details
+            }
+            events = self._events.setdefault(session_id, deque(maxlen=self.history))
+            if len(events) == events.maxlen:
+                self._evicted[session_id] = events[0]['id']
+            events.append(event)
+            self._last_event[session_id] = time.monotonic()
+            
+            if stage in FINAL_STAGES:
+                self._active_documents.discard(document_id)
+            else:
+                self._active_documents.add(document_id)
+            
+            self._prune()
+            self._condition.notify_all()
+    
+    def wait(self, session_id, after, timeout):
+        """
+        Events of the session after the given event id, waiting up to timeout for the first one
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                events = [event for event in self._events.get(session_id, ()) if event['id'] > after]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._condition.wait(remaining)
+    
+    def latest_id(self):
+        """
+        Id of the most recent event in this process
+        """
+        with self._condition:
+            return self._sequence
+    
+    def event_id(self, sequence):
+        """
+        Event id for the client, naming this process
+        """
+        return f"{self.process_id}-{sequence}"
+    
+    def parse_event_id(self, session_id, event_id):
+        """
+        Event number of an id this process issued, when it still has every later
+        event of the session; None for ids of another process (or from before a
+        restart) and for listeners that fell too far behind
+        """
+        process_id, _, sequence = (event_id or "").partition("-")
+        if process_id != self.process_id or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        with self._condition:
+            if sequence > self._sequence or self._evicted.get(session_id, 0) > sequence:
+                return None
+        return sequence
+    
+    def is_tracked(self, document_id):
+        """
+        Whether this process is processing the document and will publish its progress
+        """
+        with self._condition:
+            return document_id in self._active_documents
+    
+    def _prune(self):
+        """
+        Forget the history of sessions without recent events
+        """
+        cutoff = time.monotonic() - self.idle_session_seconds
+        for session_id in [session_id for session_id, last in self._last_event.items() if last < cutoff]:
+            self._events.pop(session_id, None)
+            self._evicted.pop(session_id, None)
+            self._last_event.pop(session_id, None)
+
+progress_broker = ProgressBroker()
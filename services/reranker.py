@@ -0,0 +1,159 @@
+import math
+import time
+import logging
+from collections import Counter
+from config import Config
+from services.text_utils import tokenize
+
+logger = logging.getLogger(__name__)
+
+class Reranker:
+    """
+    CPU-only two-stage ranking of passages: a BM25 first pass picks the
+    candidates, then cheap features are computed column by column over the
+    whole candidate set and combined into the final score.
+    """
+    weights = {
+        'bm25': 0.35,
+        'coverage': 0.25,
+        'proximity': 0.15,
+        'phrase': 0.15,
+        'structure': 0.05,
+        'recency': 0.05
+    }
+    
+    def __init__(self, candidates=None, top_n=None):
+        self.candidates = candidates or Config.RERANK_CANDIDATES
+        self.top_n = top_n or Config.RERANK_TOP_N
+    
+    def retrieve(self, query, passages):
+        """
+        First pass: the passages with the best BM25 score for the query.
+        Sets 'score' on each returned passage.
+        """
+        query_terms = set(tokenize(query))
+        if not query_terms or not passages:
+            return []
+        
+        term_counts = [Counter(tokenize(passage['content'])) for passage in passages]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        average_length = (sum(lengths) / len(lengths)) or 1
+        
+        document_frequency = Counter()
+        for counts in term_counts:
+            document_frequency.update(query_terms & counts.keys())
+        
+        total = len(passages)
+        idf = {
+            term: math.log(1 + (total - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            for term in query_terms
+        }
+        
+        k1, b = 1.2, 0.75
+        scored = []
+        for passage, counts, length in zip(passages, term_counts, lengths):
+            score = 0.0
+            for term in query_terms:
+                frequency = counts.get(term, 0)
+                if frequency:
+                    score += idf[term] * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / average_length))
+            if score > 0:
+                passage['score'] = score
+                scored.append(passage)
+        
+        scored.sort(key=lambda passage: passage['score'], reverse=True)
+        return scored[:self.candidates]
+    
+    def rerank(self, query, candidates):
+        """
+        Second pass: order candidates by a weighted sum of normalized features
+        and keep the best top_n. Returns the selected passages and the latency in ms.
+        """
+        started = time.perf_counter()
+        if not candidates:
+            return [], 0.0
+        
+        query_tokens = tokenize(query)
+        query_terms = set(query_tokens)
+        query_bigrams = {
+            (first, second) for first, second in zip(query_tokens, query_tokens[1:])
+        }
+        
+        # Token positions of the query terms in every candidate
+        positions = []
+        for candidate in candidates:
+            tokens = tokenize(candidate['content'], remove_stopwords=True)
+            positions.append((tokens, [i for i, token in enumerate(tokens) if token in query_terms]))
+        
+        columns = {
+            'bm25': self._normalize([candidate.get('score', 0.0) for candidate in candidates]),
+            'coverage': [
+                len({tokens[i] for i in hits}) / len(query_terms)
+                for tokens, hits in positions
+            ],
+            'proximity': [self._proximity(tokens, hits) for tokens, hits in positions],
+            'phrase': [
+                self._phrase_matches(tokens, query_bigrams) for tokens, hits in positions
+            ],
+            'structure': [
+                1.0 if candidate.get('section') else 0.0 for candidate in candidates
+            ],
+            'recency': self._normalize([
+                candidate['upload_date'].timestamp() if candidate.get('upload_date') else 0.0
+                for candidate in candidates
+            ])
+        }
+        
+        scores = [0.0] * len(candidates)
+        for feature, values in columns.items():
+            weight = self.weights[feature]
+            scores = [score + weight * value for score, value in zip(scores, values)]
+        
+        for candidate, score in zip(candidates, scores):
+            candidate['rerank_score'] = round(score, 4)
+        
+        ranked = sorted(candidates, key=lambda candidate: candidate['rerank_score'], reverse=True)
+        latency_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Re-ranked {len(candidates)} candidates to {min(self.top_n, len(ranked))} in {latency_ms:.1f} ms")
+        return ranked[:self.top_n], latency_ms
+    
+    def _normalize(self, values):
+        """
+        Scale a feature column to [0, 1]
+        """
+        low, high = min(values), max(values)
+        if high == low:
+            return [1.0 if high else 0.0] * len(values)
+        return [(value - low) / (high - low) for value in values]
+    
+    def _proximity(self, tokens, hits):
+        """
+        How tightly the distinct query terms cluster: terms found divided by the
+        length of the smallest window containing all of them
+        """
+        distinct = {tokens[i] for i in hits}
+        if len(distinct) < 2:
+            return 1.0 if distinct else 0.0
+        
+        window = Counter()
+        best = len(tokens)
+        start = 0
+        for end in hits:
+            window[tokens[end]] += 1
+            while len(window) == len(distinct):
+                best = min(best, end - hits[start] + 1)
+                window[tokens[hits[start]]] -= 1
+                if not window[tokens[hits[start]]]:
+                    del window[tokens[hits[start]]]
+                start += 1
+        
+        return len(distinct) / best
+    
+    def _phrase_matches(self, tokens, query_bigrams):
+        """
+        Fraction of the query's word pairs that appear as a phrase
+        """
+        if not query_bigrams:
+            return 0.0
+        found = {(first, second) for first, second in zip(tokens, tokens[1:])} & query_bigrams
+        return len(found) / len(query_bigrams)
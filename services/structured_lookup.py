@@ -0,0 +1,164 @@
+import json
+import time
+import logging
+from config import Config
+from models import ExtractedTable, KeyValuePair
+from services.text_utils import tokenize
+from app import db
+
+logger = logging.getLogger(__name__)
+
+def normalize_key(text):
+    """
+    Normalized form of a key or header used for exact lookups
+    """
+    return " ".join(tokenize(text))[:255]
+
+class StructuredLookupService:
+    """
+    Answers exact key-value and simple table lookups straight from the stored
+    extraction results, without an LLM round trip.
+    """
+    def store(self, document, extracted_data):
+        """
+        Persist the tables and key-value pairs of an analyzed document.
+        The caller commits the session.
+        """
+        for table_index, table in enumerate(extracted_data.get('tables', [])):
+            extracted_table = ExtractedTable()
+            extracted_table.document_id = document.id
+            extracted_table.table_index = table_index
+            extracted_table.page_number = table.get('page_number')
+            extracted_table.row_count = table.get('row_count', 0)
+            extracted_table.headers = json.dumps(table['headers'])
+            extracted_table.columns = json.dumps(table['columns'])
+            db.session.add(extracted_table)
+        
+        for pair in extracted_data.get('key_value_pairs', []):
+            normalized = normalize_key(pair['key'])
+            if not normalized:
+                continue
+            
+            key_value_pair = KeyValuePair()
+            key_value_pair.document_id = document.id
+            key_value_pair.key = pair['key']
+            key_value_pair.normalized_key = normalized
+            key_value_pair.value = pair['value']
+            key_value_pair.page_number = pair.get('page_number')
+            key_value_pair.confidence = pair.get('confidence')
+            db.session.add(key_value_pair)
+    
+    def lookup(self, question, documents):
+        """
+        Answer the question from stored key-value pairs or tables.
+        Returns a response dict, or None when there is no confident match.
+        """
+        started = time.perf_counter()
+        question_terms = tokenize(question)
+        if not question_terms or not documents:
+            return None
+        
+        names = {doc.id: doc.original_filename for doc in documents}
+        match = self._lookup_key_value(question_terms, names) or self._lookup_table(question_terms, names)
+        if match is None:
+            return None
+        
+        answer, source, confidence = match
+        lookup_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Answered from structured store in {lookup_ms:.1f} ms (confidence {confidence:.2f})")
+        
+        return {
+            "response": answer,
+            "sources": [source],
+            "context_used": 1,
+            "mode": "structured_lookup",
+            "timings": {
+                "lookup_ms": round(lookup_ms, 2)
+            }
+        }
+    
+    def _lookup_key_value(self, question_terms, names):
+        """
+        Match phrases of the question against the indexed normalized keys, longest first
+        """
+        # Long questions aren't key lookups
+        if len(question_terms) > 12:
+            return None
+        
+        phrases = {}
+        for length in range(len(question_terms), 0, -1):
+            for start in range(len(question_terms) - length + 1):
+                phrases.setdefault(" ".join(question_terms[start:start + length]), length)
+        
+        pairs = KeyValuePair.query.filter(
+            KeyValuePair.document_id.in_(names.keys()),
+            KeyValuePair.normalized_key.in_(phrases.keys())
+        ).all()
+        if not pairs:
+            return None
+        
+        # The key has to account for most of the question to be a confident answer
+        best_length = max(phrases[pair.normalized_key] for pair in pairs)
+        confidence = best_length / len(question_terms)
+        if confidence < Config.STRUCTURED_LOOKUP_MIN_CONFIDENCE:
+            return None
+        
+        best = [pair for pair in pairs if phrases[pair.normalized_key] == best_length]
+        if len({pair.value.strip() for pair in best}) > 1:
+            # Same key with different values (e.g. several invoices): let the LLM sort it out
+            return None
+        
+        pair = best[0]
+        source = {
+            'document_name': names[pair.document_id],
+            'page_number': pair.page_number or 'n/a',
+            'section': 'Key-Value Pairs'
+        }
+        return f"{pair.key.rstrip(':')}: {pair.value}", source, confidence
+    
+    def _lookup_table(self, question_terms, names):
+        """
+        Find a table cell whose column header and row label both appear in the question
+        """
+        question_set = set(question_terms)
+        candidates = []
+        
+        for table in ExtractedTable.query.filter(ExtractedTable.document_id.in_(names.keys())).all():
+            headers = json.loads(table.headers or "[]")
+            columns = json.loads(table.columns or "[]")
+            if len(columns) < 2:
+                continue
+            
+            row_labels = [set(tokenize(label)) for label in columns[0]]
+            for column_index, header in enumerate(headers[1:], start=1):
+                header_terms = set(tokenize(header))
+                if not header_terms or not header_terms <= question_set:
+                    continue
+                
+                for row_index, label_terms in enumerate(row_labels):
+                    if not label_terms or not label_terms <= question_set:
+                        continue
+                    
+                    value = columns[column_index][row_index] if row_index < len(columns[column_index]) else ""
+                    if not value:
+                        continue
+                    
+                    confidence = len(header_terms | label_terms) / len(question_set)
+                    candidates.append((confidence, table, header, columns[0][row_index], value))
+        
+        if not candidates:
+            return None
+        
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        confidence, table, header, label, value = candidates[0]
+        if confidence < Config.STRUCTURED_LOOKUP_MIN_CONFIDENCE:
+            return None
+        if len(candidates) > 1 and candidates[1][0] == confidence and candidates[1][4] != value:
+            return None
+        
+        source = {
+            'document_name': names[table.document_id],
+            'page_number': table.page_number or 'n/a',
+            'section': f"Table {table.table_index + 1}"
+        }
+        return f"{header} for {label}: {value}", source, confidence
@@ -0,0 +1,94 @@
+import re
+
+STOPWORDS = {
+    'a', 'about', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'did', 'do', 'does',
+    'for', 'from', 'has', 'have', 'how', 'i', 'in', 'is', 'it', 'its', 'me', 'my', 'of',
+    'on', 'or', 'our', 'please', 'tell', 'that', 'the', 'their', 'there', 'these', 'this',
+    'to', 'was', 'we', 'were', 'what', 'when', 'where', 'which', 'who', 'why', 'will',
+    'with', 'you', 'your'
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text, remove_stopwords=True):
+    """
+    Lowercase word tokens of a text, optionally without stopwords
+    """
+    tokens = TOKEN_PATTERN.findall((text or "").lower())
+    if remove_stopwords:
+        return [token for token in tokens if token not in STOPWORDS]
+    return tokens
+
+def estimate_tokens(text):
+    """
+    Rough LLM token estimate (about four characters per token)
+    """
+    return len(text or "") // 4 + 1
+
+def split_text(text, max_chars):
+    """
+    Split text into pieces of at most max_chars, breaking at the last space
+    before the limit where there is one, so nothing is cut off
+    """
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars + 1)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+SECTION_MARKER = re.compile(r"^--- (.+) ---$")
+
+def split_into_passages(content, max_chars=800):
+    """
+    Split extracted document text into passages of at most max_chars.
+    Passages never span the "--- Page N ---" / "--- Table N ---" markers written
+    by DocumentIntelligenceService, and keep their page number and section.
+    Lines longer than max_chars are split into several passages.
+    """
+    passages = []
+    page_number = 1
+    section = ""
+    lines = []
+    size = 0
+    
+    def flush():
+        if lines:
+            passages.append({
+                'content': "\n".join(lines),
+                'page_number': page_number,
+                'section': section
+            })
+    
+    for line in (content or "").splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        
+        marker = SECTION_MARKER.match(stripped)
+        if marker:
+            flush()
+            lines, size = [], 0
+            label = marker.group(1)
+            if label.startswith("Page ") and label[5:].isdigit():
+                page_number = int(label[5:])
+                section = ""
+            else:
+                # Tables and key-value pairs follow the pages and have no page of their own
+                page_number = None
+                section = label
+            continue
+        
+        for segment in split_text(stripped, max_chars):
+            if lines and size + len(segment) > max_chars:
+                flush()
+                lines, size = [], 0
+            lines.append(segment)
+            size += len(segment) + 1
+    
+    flush()
+    return passages
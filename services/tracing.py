@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import random
+import logging
+import secrets
+import threading
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "rag-document-chat"
+
+# Static files, and event streams whose duration is the connection lifetime rather than work done
+UNTRACED_ENDPOINTS = {'static', 'documents.document_events'}
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """
+    One timed operation within a trace
+    """
+    def __init__(self, trace, name, parent=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+    
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+    
+    def finish(self, end_ns=None):
+        self.end_ns = end_ns or time.time_ns()
+    
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+class _NoopSpan:
+    """
+    Stands in for a span when no trace is active
+    """
+    def set_attribute(self, key, value):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Trace:
+    """
+    The spans of one request; spans may be added from worker threads
+    """
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self._lock = threading.Lock()
+    
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+class Tracer:
+    """
+    Lightweight request tracing. The current span lives in a context variable,
+    so nested spans attach to their caller without passing anything around.
+    Finished traces are kept in memory for the admin page and written to a
+    rotating file as OTLP/JSON, one export request per line. Both are per
+    worker process: each process writes its own file, named after its pid,
+    as rotation isn't safe with several processes writing one file.
+    """
+    def __init__(self):
+        self.recent = deque(maxlen=Config.TRACE_RECENT_LIMIT)
+        self._exporter = None
+        self._exporter_pid = None
+        self._exporter_lock = threading.Lock()
+    
+    def begin(self, name, **attributes):
+        """
+        Start a trace with its root span. Returns a handle for end(), or None when not sampled.
+        """
+        if not Config.TRACING_ENABLED or random.random() >= Config.TRACE_SAMPLE_RATE:
+            return None
+        trace = Trace()
+        span = Span(trace, name, attributes=attributes)
+        trace.add(span)
+        return span, _current_span.set(span)
+    
+    def end(self, handle, error=None):
+        """
+        Finish a trace started with begin() and export it
+        """
+        if handle is None:
+            return
+        span, token = handle
+        if error is not None:
+            span.error = str(error)
+        span.finish()
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Ended from a different context; the root span is finished either way
+            pass
+        self._export(span.trace)
+    
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Time the block as a child of the current span; a no-op outside a trace
+        """
+        parent = _current_span.get()
+        if parent is None:
+            yield NOOP_SPAN
+            return
+        
+        span = Span(parent.trace, name, parent, attributes)
+        parent.trace.add(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = str(e) or type(e).__name__
+            raise
+        finally:
+            span.finish()
+            _current_span.reset(token)
+    
+    def record(self, name, start_ns, end_ns, **attributes):
+        """
+        Add an already finished child span to the current trace
+        """
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = Span(parent.trace, name, parent, attributes)
+        span.start_ns = start_ns
+        span.finish(end_ns)
+        parent.trace.add(span)
+    
+    def current_span(self):
+        return _current_span.get() or NOOP_SPAN
+    
+    def slowest(self, limit=20):
+        """
+        The slowest of the recently finished traces
+        """
+        return sorted(list(self.recent), key=lambda trace: trace['duration_ms'], reverse=True)[:limit]
+    
+    def _export(self, trace):
+        root = trace.spans[0]
+        with trace._lock:
+            spans = sorted(trace.spans, key=lambda span: span.start_ns)
+        
+        self.recent.append({
+            'trace_id': trace.trace_id,
+            'name': root.name,
+            'started': root.start_ns / 1e9,
+            'duration_ms': round(root.duration_ms, 1),
+            'error': root.error,
+            'attributes': root.attributes,
+            'spans': [
+                {
+                    'name': span.name,
+                    'depth': span.depth,
+                    'offset_ms': round((span.start_ns - root.start_ns) / 1e6, 1),
+                    'duration_ms': round(span.duration_ms, 1),
+                    'attributes': span.attributes,
+                    'error': span.error
+                }
+                for span in spans
+            ]
+        })
+        
+        exporter = self._get_exporter()
+        if exporter is not None:
+            exporter.info(json.dumps(self._to_otlp(trace.trace_id, spans)))
+    
+    def _get_exporter(self):
+        """
+        Logger writing to this process's rotating trace file, created on first
+        use and again in a forked child
+        """
+        if not Config.TRACE_FILE:
+            return None
+        with self._exporter_lock:
+            if self._exporter is None or self._exporter_pid != os.getpid():
+                path = trace_file_path()
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                handler = RotatingFileHandler(
+                    path,
+                    maxBytes=Config.TRACE_FILE_MAX_BYTES,
+                    backupCount=Config.TRACE_FILE_BACKUP_COUNT
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                exporter = logging.getLogger('rag.traces')
+                exporter.setLevel(logging.INFO)
+                exporter.propagate = False
+                # A handler inherited from the parent process points at the parent's file
+                for inherited in list(exporter.handlers):
+                    exporter.removeHandler(inherited)
+                exporter.addHandler(handler)
+                self._exporter = exporter
+                self._exporter_pid = os.getpid()
+            return self._exporter
+    
+    def _to_otlp(self, trace_id, spans):
+        """
+        OTLP/JSON ExportTraceServiceRequest for one trace
+        """
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': _otlp_attributes({'service.name': SERVICE_NAME, 'process.pid': os.getpid()})},
+                'scopeSpans': [{
+                    'scope': {'name': __name__},
+                    'spans': [
+                        {
+                            'traceId': trace_id,
+                            'spanId': span.span_id,
+                            'parentSpanId': span.parent.span_id if span.parent else "",
+                            'name': span.name,
+                            'kind': 2 if span.parent is None else 1,  # SERVER for the request, INTERNAL otherwise
+                            'startTimeUnixNano': str(span.start_ns),
+                            'endTimeUnixNano': str(span.end_ns or span.start_ns),
+                            'attributes': _otlp_attributes(span.attributes),
+                            'status': {'code': 2, 'message': span.error} if span.error else {'code': 1}
+                        }
+                        for span in spans
+                    ]
+                }]
+            }]
+        }
+
+def trace_file_path(pid=None):
+    """
+    Trace file of a worker process: TRACE_FILE with the pid before the extension
+    """
+    root, extension = os.path.splitext(Config.TRACE_FILE)
+    return f"{root}.{pid or os.getpid()}{extension}"
+
+def _otlp_attributes(attributes):
+    """
+    Attributes as OTLP key/value pairs
+    """
+    converted = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            encoded = {'boolValue': value}
+        elif isinstance(value, int):
+            encoded = {'intValue': str(value)}
+        elif isinstance(value, float):
+            encoded = {'doubleValue': value}
+        else:
+            encoded = {'stringValue': str(value)}
+        converted.append({'key': key, 'value': encoded})
+    return converted
+
+def bind_context(fn):
+    """
+    Run fn in a copy of the caller's context, so spans it starts on a worker
+    thread join the caller's trace. Bind once per submitted call.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+tracer = Tracer()
+
+def init_tracing(app):
+    """
+    Trace every request and time its database queries
+    """
+    from flask import g, request
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    
+    @app.before_request
+    def start_request_trace():
+        if request.endpoint in UNTRACED_ENDPOINTS:
+            return
+        route = request.url_rule.rule if request.url_rule else request.path
+        g.trace_handle = tracer.begin(
+            f"{request.method} {route}",
+            **{'http.method': request.method, 'http.route': route, 'http.target': request.path}
+        )
+    
+    @app.after_request
+    def record_status(response):
+        tracer.current_span().set_attribute('http.status_code', response.status_code)
+        return response
+    
+    @app.teardown_request
+    def end_request_trace(error=None):
+        tracer.end(g.pop('trace_handle', None), error)
+    
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def start_query_span(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('trace_query_start', []).append(time.time_ns())
+    
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def end_query_span(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('trace_query_start')
+        if not starts:
+            return
+        tracer.record(
+            'db.query',
+            starts.pop(),
+            time.time_ns(),
+            **{
+                'db.statement': statement[:Config.TRACE_DB_STATEMENT_CHARS],
+                'db.rows': cursor.rowcount if cursor.rowcount is not None else -1
+            }
+        )
+    
+    @event.listens_for(Engine, 'handle_error')
+    def drop_failed_query(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('trace_query_start'):
+            connection.info['trace_query_start'].pop()
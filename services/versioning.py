@@ -0,0 +1,242 @@
+import json
+import hashlib
+import logging
+from models import Document, DocumentVersion, DocumentPage
+from app import db
+
+# Optional dependency: without it only byte-identical re-uploads reuse earlier results
+try:
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+except ImportError:
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+# Back-references that would pull the whole document into a page's hash
+SKIPPED_KEYS = {'/Parent', '/P'}
+
+class DocumentVersioning:
+    """
+    Page-level versions of documents. A re-upload of a document already in the
+    session is compared with its current version page by page using content
+    hashes, so only new or changed pages have to be analyzed again; the stored
+    extraction results of the other pages are reused.
+    """
+    def find_current(self, session_id, original_filename):
+        """
+        The indexed document a new upload with this name is a revision of
+        """
+        return Document.query.filter_by(
+            session_id=session_id,
+            original_filename=original_filename,
+            status='indexed'
+        ).order_by(Document.upload_date.desc()).first()
+    
+    def file_hash(self, file_path):
+        """
+        SHA-256 of a file's bytes
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def page_hashes(self, file_path, filename):
+        """
+        Content hash of each page of a PDF, or None for other files.
+        Covers the content stream and everything it draws through the page's
+        resources: form XObjects (recursively), images, fonts and the like.
+        """
+        if PdfReader is None or not filename.lower().endswith('.pdf'):
+            return None
+        
+        try:
+            hashes = []
+            # Objects shared by several pages, like fonts, are hashed once
+            cache = {}
+            for page in PdfReader(file_path).pages:
+                digest = hashlib.sha256()
+                digest.update(f"{list(page.mediabox)}:{page.rotation}".encode())
+                contents = page.get_contents()
+                if contents is not None:
+                    digest.update(contents.get_data())
+                digest.update(self._hash_object(page.get('/Resources'), cache))
+                hashes.append(digest.hexdigest())
+            return hashes
+        except Exception as e:
+            logger.warning(f"Could not hash the pages of {filename}: {str(e)}")
+            return None
+    
+    def plan(self, document, file_hash, page_hashes):
+        """
+        Work out what a revision of the document needs analyzed.
+        Returns (reused, changed): reused maps page numbers of the new file to
+        the extraction of an identical page of the current version, changed
+        lists the page numbers to analyze, or is None to analyze the whole file.
+        """
+        version = db.session.get(DocumentVersion, document.current_version_id) if document.current_version_id else None
+        stored_pages = DocumentPage.query.filter_by(version_id=version.id).all() if version else []
+        if not stored_pages:
+            return {}, None
+        
+        if version.file_hash == file_hash:
+            return {page.page_number: json.loads(page.extraction) for page in stored_pages}, []
+        
+        if page_hashes is None:
+            return {}, None
+        
+        # Match by content rather than position so inserted or removed pages don't shift everything
+        by_hash = {page.content_hash: page for page in stored_pages}
+        reused = {}
+        changed = []
+        for page_number, content_hash in enumerate(page_hashes, start=1):
+            page = by_hash.get(content_hash)
+            if page is None:
+                changed.append(page_number)
+            else:
+                reused[page_number] = self._renumber(json.loads(page.extraction), page_number)
+        return reused, changed
+    
+    def subset_pdf(self, file_path, page_numbers):
+        """
+        Write a PDF with only the given pages and return its path
+        """
+        reader = PdfReader(file_path)
+        writer = PdfWriter()
+        for page_number in page_numbers:
+            writer.add_page(reader.pages[page_number - 1])
+        
+        subset_path = f"{file_path}.pages.pdf"
+        with open(subset_path, 'wb') as subset_file:
+            writer.write(subset_file)
+        return subset_path
+    
+    def split_pages(self, extracted_data):
+        """
+        Group an extraction result by page. Tables and key-value pairs belong
+        to the page they start on.
+        """
+        pages = {
+            page['page_number']: {'text': page['text'], 'tables': [], 'key_value_pairs': []}
+            for page in extracted_data.get('pages', [])
+        }
+        if not pages:
+            return pages
+        
+        first_page = min(pages)
+        for table in extracted_data.get('tables', []):
+            pages.get(table.get('page_number'), pages[first_page])['tables'].append(table)
+        for pair in extracted_data.get('key_value_pairs', []):
+            pages.get(pair.get('page_number'), pages[first_page])['key_value_pairs'].append(pair)
+        return pages
+    
+    def assemble(self, pages, page_count=None):
+        """
+        Rebuild an extraction result in the format of DocumentIntelligenceService
+        from per-page results. Pages missing up to page_count (dropped as blank
+        before upload) are kept empty so page numbers stay stable.
+        """
+        pages = dict(pages)
+        for page_number in range(1, (page_count or 0) + 1):
+            pages.setdefault(page_number, {'text': "", 'tables': [], 'key_value_pairs': []})
+        
+        content = ""
+        tables = []
+        key_value_pairs = []
+        for page_number in sorted(pages):
+            page = pages[page_number]
+            content += f"\n--- Page {page_number} ---\n" + page['text']
+            tables.extend(page['tables'])
+            key_value_pairs.extend(page['key_value_pairs'])
+        
+        for table_index, table in enumerate(tables):
+            content += f"\n--- Table {table_index + 1} ---\n" + table.get('text', "")
+        
+        if key_value_pairs:
+            content += "\n--- Key-Value Pairs ---\n"
+            content += "".join(f"{pair['key']}: {pair['value']}\n" for pair in key_value_pairs)
+        
+        return {
+            'content': content.strip(),
+            'page_count': len(pages),
+            'pages': [{'page_number': number, 'text': pages[number]['text']} for number in sorted(pages)],
+            'tables': tables,
+            'key_value_pairs': key_value_pairs
+        }
+    
+    def record_version(self, document, file_hash, file_size, pages, page_hashes, pages_analyzed, pages_reused):
+        """
+        Store a new version with its pages and point the document at it.
+        Pages of the previous version are dropped as only the current one is diffed against.
+        The caller commits the session.
+        """
+        previous = db.session.get(DocumentVersion, document.current_version_id) if document.current_version_id else None
+        
+        version = DocumentVersion()
+        version.document_id = document.id
+        version.version_number = previous.version_number + 1 if previous else 1
+        version.file_hash = file_hash
+        version.file_size = file_size
+        version.page_count = len(pages)
+        version.pages_analyzed = pages_analyzed
+        version.pages_reused = pages_reused
+        db.session.add(version)
+        db.session.flush()
+        
+        for page_number, extraction in pages.items():
+            page = DocumentPage()
+            page.version_id = version.id
+            page.page_number = page_number
+            if page_hashes and page_number <= len(page_hashes):
+                page.content_hash = page_hashes[page_number - 1]
+            else:
+                # Pages of files that can't be split are only reused when the whole file matches
+                page.content_hash = hashlib.sha256(f"{file_hash}:{page_number}".encode()).hexdigest()
+            page.extraction = json.dumps(extraction)
+            db.session.add(page)
+        
+        if previous is not None:
+            DocumentPage.query.filter_by(version_id=previous.id).delete(synchronize_session=False)
+        
+        document.current_version_id = version.id
+        return version
+    
+    def _hash_object(self, obj, cache, visiting=frozenset()):
+        """
+        Digest of a PDF object and everything it references. Referenced objects
+        are hashed by content rather than object number, so identical pages of
+        different files match.
+        """
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key in cache:
+                return cache[key]
+            if key in visiting:
+                return b"cycle"
+            cache[key] = self._hash_object(obj.get_object(), cache, visiting | {key})
+            return cache[key]
+        
+        digest = hashlib.sha256(type(obj).__name__.encode())
+        if isinstance(obj, DictionaryObject):
+            for name in sorted(obj):
+                if name not in SKIPPED_KEYS:
+                    digest.update(name.encode())
+                    digest.update(self._hash_object(obj.raw_get(name), cache, visiting))
+            if isinstance(obj, StreamObject):
+                digest.update(obj.get_data())
+        elif isinstance(obj, ArrayObject):
+            for item in obj:
+                digest.update(self._hash_object(item, cache, visiting))
+        elif obj is not None:
+            digest.update(repr(obj).encode())
+        return digest.digest()
+    
+    def _renumber(self, extraction, page_number):
+        """
+        Move a reused page's tables and key-value pairs to its new page number
+        """
+        for item in extraction['tables'] + extraction['key_value_pairs']:
+            item['page_number'] = page_number
+        return extraction
@@ -10,8 +10,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize file upload enhancements
     initializeFileUpload();
     
-    // Initialize auto-refresh for processing documents
-    initializeAutoRefresh();
+    // Follow progress of processing documents
+    initializeProgressEvents();
 });
 
 // Theme Management
@@ -108,25 +108,34 @@ function initializeFileUpload() {
     }
 }
 
-// Auto-refresh for processing documents
-function initializeAutoRefresh() {
+// Live progress for processing documents, pushed by the server
+function initializeProgressEvents() {
     // Check if we're on the documents page with processing documents
-    const processingBadges = document.querySelectorAll('.badge.bg-warning');
+    const processingCards = document.querySelectorAll('[data-document-id][data-status="processing"]');
     
-    if (processingBadges.length > 0) {
-        console.log(`Found ${processingBadges.length} processing documents. Starting auto-refresh.`);
+    if (processingCards.length === 0 || !window.EventSource) {
+        return;
+    }
+    
+    const source = new EventSource('/documents/events');
+    
+    source.addEventListener('progress', function(e) {
+        const progress = JSON.parse(e.data);
+        const card = document.querySelector(`[data-document-id="${progress.document_id}"]`);
         
-        // Refresh every 5 seconds
-        const refreshInterval = setInterval(() => {
-            location.reload();
-        }, 5000);
+        if (card && progress.message) {
+            const label = card.querySelector('.document-progress');
+            if (label) {
+                label.textContent = progress.message;
+            }
+        }
         
-        // Stop refreshing after 5 minutes to prevent infinite loops
-        setTimeout(() => {
-            clearInterval(refreshInterval);
-            console.log('Auto-refresh stopped after 5 minutes.');
-        }, 300000);
-    }
+        // Re-render once a document is ready or failed, or a new one shows up
+        if (progress.status !== 'processing' && (!card || card.dataset.status !== progress.status)) {
+            source.close();
+            location.reload();
+        }
+    });
 }
 
 // Utility Functions
@@ -326,12 +335,13 @@ const API = {
     },
     
     // Send chat message
-    sendMessage: async function(question, documentNames = null) {
+    sendMessage: async function(question, documentNames = null, llmFollowup = false) {
         return this.call('/chat/ask', {
             method: 'POST',
             body: JSON.stringify({
                 question: question,
-                document_names: documentNames
+                document_names: documentNames,
+                llm_followup: llmFollowup
             })
         });
     },
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Keep the app's schema setup away from the database in instance/
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+
+# Models need the app (and its db) created first, as in main.py
+import app
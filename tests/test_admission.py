@@ -0,0 +1,81 @@
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from services.admission import AdmissionController, AdmissionRejected
+from services.tracing import bind_context
+
+def make_controller(**overrides):
+    settings = dict(max_concurrent=4, max_queue=2, queue_timeout=0.2, per_session_limit=2, per_session_slots=2)
+    settings.update(overrides)
+    return AdmissionController('test', **settings)
+
+def test_one_session_cannot_take_every_slot():
+    controller = make_controller()
+    releases = []
+    
+    # Two questions of one session fanning out into four calls each
+    with controller.session('heavy'):
+        releases.append(controller.acquire())
+        releases.append(controller.acquire())
+        with pytest.raises(AdmissionRejected) as rejected:
+            controller.acquire(timeout=0.05)
+        assert rejected.value.status_code == 429
+    
+    # Another session still gets a slot straight away
+    with controller.session('light'):
+        releases.append(controller.acquire(timeout=0))
+    
+    stats = controller.stats()
+    assert stats['active'] == 3
+    assert stats['queue_depth'] == 0
+    for release in releases:
+        release()
+    assert controller.stats()['active'] == 0
+
+def test_session_calls_wait_for_their_own_share():
+    controller = make_controller()
+    started = threading.Event()
+    finish = threading.Event()
+    
+    def call():
+        release = controller.acquire(timeout=0.2, session_timeout=5)
+        started.set()
+        finish.wait(5)
+        release()
+        return True
+    
+    with controller.session('heavy'), ThreadPoolExecutor(max_workers=4) as executor:
+        # Workers inherit the session the calls are charged to, like map-reduce shards
+        futures = [executor.submit(bind_context(call)) for _ in range(4)]
+        assert started.wait(5)
+        assert controller.stats()['active'] == 2
+        
+        with controller.charge_to('other'):
+            other = controller.acquire(timeout=0)
+        other()
+        
+        finish.set()
+        assert all(future.result() for future in futures)
+    
+    assert controller.stats()['active'] == 0
+    assert controller.stats()['sessions_holding_slots'] == 0
+
+def test_hedged_attempts_respect_the_share():
+    controller = make_controller(per_session_slots=1)
+    with controller.charge_to('heavy'):
+        release = controller.acquire()
+        assert controller.try_acquire() is None
+        release()
+        hedge = controller.try_acquire()
+    assert hedge is not None
+    hedge()
+
+def test_session_request_limit():
+    controller = make_controller()
+    first = controller.hold_session('s')
+    second = controller.hold_session('s')
+    with pytest.raises(AdmissionRejected):
+        controller.hold_session('s')
+    first()
+    second()
+    controller.hold_session('s')()
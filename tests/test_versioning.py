@@ -0,0 +1,56 @@
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, NameObject
+from services.versioning import DocumentVersioning
+
+def form(writer, text):
+    """
+    A form XObject drawing the text in Helvetica
+    """
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica')
+    })
+    stream = DecodedStreamObject()
+    stream.set_data(f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode())
+    stream.update({
+        NameObject('/Type'): NameObject('/XObject'),
+        NameObject('/Subtype'): NameObject('/Form'),
+        NameObject('/BBox'): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(612), FloatObject(792)]),
+        NameObject('/Resources'): DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): writer._add_object(font)})
+        })
+    })
+    return writer._add_object(stream)
+
+def write_pdf(path, texts):
+    """
+    A PDF whose pages all draw their text with the same content stream, through /Fm0 Do
+    """
+    writer = PdfWriter()
+    for text in texts:
+        page = writer.add_blank_page(612, 792)
+        contents = DecodedStreamObject()
+        contents.set_data(b"q /Fm0 Do Q")
+        page[NameObject('/Contents')] = writer._add_object(contents)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/XObject'): DictionaryObject({NameObject('/Fm0'): form(writer, text)})
+        })
+    with open(path, 'wb') as file:
+        writer.write(file)
+    return str(path)
+
+def test_pages_drawn_through_forms_hash_by_what_they_draw(tmp_path):
+    versioning = DocumentVersioning()
+    first = versioning.page_hashes(write_pdf(tmp_path / "first.pdf", ["Invoice 1", "Invoice 2"]), "first.pdf")
+    assert first[0] != first[1]
+    
+    # A revision with a page inserted: the unchanged pages still match, the new one doesn't
+    revised = versioning.page_hashes(
+        write_pdf(tmp_path / "revised.pdf", ["Cover", "Invoice 1", "Invoice 2"]), "revised.pdf"
+    )
+    assert revised[1:] == first
+    assert revised[0] not in first